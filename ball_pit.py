@@ -7,10 +7,13 @@ On collision
 
 import random
 
+import numpy as np
 import pygame
 import pygame.freetype
 import pymunk
-from typing import Any
+from collision_events import CollisionEvents
+from entity_store import EntityStore
+from game_loop import FixedTimestep
 
 
 pygame.init()
@@ -28,8 +31,11 @@ BALL_POOL_COLLISION_TYPE = 1
 BALL_SPECIAL_COLLISION_TYPE = 2
 BALL_COLOR = (255, 0, 0)
 BALL_COLORS = {BALL_SPECIAL_COLLISION_TYPE: (0, 0, 255)}
+SPRITE_COLOR_KEY = (255, 0, 255)
 GAME_FONT = pygame.freetype.SysFont("None", 24)
 hit_count = 0
+special_ball = None
+collisions = None
 
 # Rules
 BIVM = BALL_INITIAL_VELOCITY_MAGNITUDE = 80
@@ -44,22 +50,29 @@ def convert_coordinates(point):
     return int(point[0]), DISPLAY_SIZE[0] - int(point[1])
 
 
+def limit_velocity(body: pymunk.Body, gravity, damping, dt):
+    pymunk.Body.update_velocity(body, gravity, damping, dt)
+    body.velocity = body.velocity * BALL_DAMPENING_FACTOR
+
+
 class Ball:
-    def __init__(self, x, y, collision_type):
+    __slots__ = ("body", "shape")
+
+    def __init__(self, x, y, collision_type, add=True):
+        """
+        :param add: Adds the ball to the space, leave it out to add many balls at once, see drop_balls().
+        """
         self.body = pymunk.Body()
         self.body.position = x, y
         self.body.velocity = random.uniform(-BIVM, BIVM), random.uniform(-BIVM, BIVM)
-
-        def limit_velocity(body: pymunk.Body, gravity, damping, dt):
-            pymunk.Body.update_velocity(body, gravity, damping, dt)
-            body.velocity = body.velocity * BALL_DAMPENING_FACTOR
         self.body.velocity_func = limit_velocity
 
         self.shape = pymunk.Circle(self.body, BALL_RADIUS)
         self.shape.elasticity = BALL_ELASTICITY_DEFAULT
         self.shape.density = 1
         self.shape.collision_type = collision_type
-        space.add(self.body, self.shape)
+        if add:
+            space.add(self.body, self.shape)
 
     def draw(self):
         pygame.draw.circle(display,
@@ -72,6 +85,75 @@ class Ball:
         return self.shape.collision_type
 
 
+class BallCollection:
+    """
+    Every Ball in the pit, drawn together.
+
+    The balls are kept in an EntityStore, with their collision types as
+    kinds. Each frame the positions come from one batched query of the space
+    (see FixedTimestep.state) and are converted to screen coordinates with
+    numpy. A circle sprite prebuilt per collision type is then blitted for
+    every ball in a single Surface.blits call.
+    """
+
+    def __init__(self, balls=()):
+        self.balls = []
+        self.entities = EntityStore()
+        self.sprites = {}
+
+        # Sprite of each matched ball, rebuilt when the entities matched to the space change.
+        self.matched = None
+        self.ball_sprites = []
+        self.extend(balls)
+
+    def __len__(self):
+        return len(self.balls)
+
+    def __iter__(self):
+        return iter(self.balls)
+
+    def append(self, ball):
+        self.extend([ball])
+
+    def extend(self, balls):
+        balls = list(balls)
+        self.balls.extend(balls)
+        kinds = {}
+        for ball in balls:
+            kinds.setdefault(ball.collision_type, []).append(ball.body)
+        for kind, bodies in kinds.items():
+            self.entities.add_many(bodies, kind, (*BALL_COLORS.get(kind, BALL_COLOR), 255))
+
+    def sprite(self, collision_type):
+        if collision_type not in self.sprites:
+            sprite = pygame.Surface((2 * BALL_RADIUS + 1, 2 * BALL_RADIUS + 1))
+            sprite.fill(SPRITE_COLOR_KEY)
+            sprite.set_colorkey(SPRITE_COLOR_KEY, pygame.RLEACCEL)
+            pygame.draw.circle(sprite, BALL_COLORS.get(collision_type, BALL_COLOR), (BALL_RADIUS, BALL_RADIUS),
+                               BALL_RADIUS)
+            self.sprites[collision_type] = sprite.convert(display)
+        return self.sprites[collision_type]
+
+    def draw(self, surface, ids, state):
+        """
+        :param ids: Body ids of the whole space, as returned by FixedTimestep.state().
+        :param state: Matching (bodies, 3) array of x, y and angle.
+        """
+        # The space also holds the static body of the pit walls, which is not an entity.
+        rows, entities = self.entities.match(ids)
+        if entities is not self.matched:
+            kind_sprites = [self.sprite(kind) for kind in self.entities.kind_names]
+            self.ball_sprites = [kind_sprites[k] for k in self.entities.kinds[entities].tolist()]
+            self.matched = entities
+
+        # Same conversion as convert_coordinates, truncating to whole pixels.
+        position = state[rows, :2].astype(int)
+        position[:, 1] = DISPLAY_SIZE[0] - position[:, 1]
+        position -= BALL_RADIUS
+
+        surface.blits(zip(self.ball_sprites, position.tolist()), doreturn=False)
+
+
 class Pit:
     def __init__(self):
         min_dim = 5
@@ -89,19 +171,14 @@ class Pit:
         space.add(*static_lines)
 
 
-def collide_begin(arb: pymunk.Arbiter, handler_space: str, data: Any):
+def collide_begin(handler_space: pymunk.Space, pool_shapes, special_shapes, energies):
+    """Counts the step's hits on the special ball, see CollisionEvents."""
     global hit_count
 
-    hit_count += 1
-    if (hit_count % HIT_COUNT_TO_EXPLODE) == 0:
-        begin_explode(data['special_ball'])
-    return True
-
-
-def collide_end(arb: pymunk.Arbiter, handler_space: str, data: Any):
-    if data:
-        end_explode(data['special_ball'])
-    return True
+    previous = hit_count
+    hit_count += len(pool_shapes)
+    if hit_count // HIT_COUNT_TO_EXPLODE > previous // HIT_COUNT_TO_EXPLODE:
+        begin_explode(special_ball)
 
 
 def begin_explode(special_ball: Ball):
@@ -112,22 +189,42 @@ def end_explode(special_ball: Ball):
     special_ball.shape.elasticity = BALL_ELASTICITY_DEFAULT
 
 
-def game():
+def drop_balls(count, collision_type=BALL_POOL_COLLISION_TYPE):
+    """
+    Drops count balls at random positions in the pit, added to the space with a single call.
+
+    :return: List of the new Balls.
+    """
+    balls = [Ball(random.randint(0, DISPLAY_SIZE[0]), random.randint(0, DISPLAY_SIZE[1]), collision_type, add=False)
+             for _ in range(count)]
+    space.add(*(obj for ball in balls for obj in (ball.body, ball.shape)))
+    return balls
+
+
+def setup(count=COUNT_BALL_DROPPED):
+    """
+    Fills the pit in the module's space with count balls and the special ball.
+
+    :return: The BallCollection.
+    """
+    global special_ball, collisions
     Pit()
 
-    balls = [Ball(random.randint(0, DISPLAY_SIZE[0]), random.randint(0, DISPLAY_SIZE[1]), BALL_POOL_COLLISION_TYPE)
-             for _ in range(COUNT_BALL_DROPPED)]
+    balls = BallCollection(drop_balls(count))
 
     special_ball = Ball(DISPLAY_SIZE[0]/2, DISPLAY_SIZE[1]/2, BALL_SPECIAL_COLLISION_TYPE)
     special_ball.shape.elasticity = 1
     balls.append(special_ball)
-    handler = space.add_collision_handler(BALL_POOL_COLLISION_TYPE, BALL_SPECIAL_COLLISION_TYPE)
-    handler.begin = lambda arbiter, game_space, data: collide_begin(arbiter, game_space, {
-        "special_ball": special_ball
-    })
+    collisions = CollisionEvents(space)
+    collisions.on(BALL_POOL_COLLISION_TYPE, BALL_SPECIAL_COLLISION_TYPE, collide_begin)
+    return balls
+
 
-    handler.separate = collide_end
+def game():
+    balls = setup()
 
+    loop = FixedTimestep(space, step_rate=FPS)
+    frame_time = 0.0
     while True:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -136,22 +233,22 @@ def game():
                 if event.key == pygame.K_ESCAPE:
                     return
                 if event.key == pygame.K_b:
-                    more_balls = [Ball(random.randint(0, DISPLAY_SIZE[0]), random.randint(0, DISPLAY_SIZE[1]),
-                                       BALL_POOL_COLLISION_TYPE) for _ in range(COUNT_BALL_DROPPED)]
-                    balls.extend(more_balls)
+                    balls.extend(drop_balls(COUNT_BALL_DROPPED))
+
+        loop.advance(frame_time)
 
         display.fill(DISPLAY_COLOR)
 
-        [ball.draw() for ball in balls]
+        balls.draw(display, *loop.state())
 
         GAME_FONT.render_to(display, (40, 40), "More [B]alls", (0, 0, 0))
         GAME_FONT.render_to(display, (40, 60), "Hit Count: " + str(hit_count), (0, 0, 0))
 
         pygame.display.update()
-        clock.tick(FPS)
-        space.step(1 / FPS)
+        frame_time = clock.tick(FPS) / 1000
 
 
-game()
+if __name__ == "__main__":
+    game()
 
-pygame.quit()
+    pygame.quit()
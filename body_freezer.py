@@ -0,0 +1,183 @@
+"""
+Settled piles of bodies that cost next to nothing until something hits them.
+
+enable_sleeping() turns on pymunk's sleeping: an island of touching bodies
+that has been at rest for a while stops being solved, until a collision or
+a change wakes it. A BodyFreezer goes one step further for bodies that stay
+asleep. Every few steps, when due() says so, update() turns those asleep for
+long enough into static bodies, whose shapes move to the static spatial
+index and never reach the solver. thaw() makes a frozen body dynamic again, along with the frozen bodies
+resting on it, and on those, so the part of a pile above a hit falls with it
+instead of hanging in mid-air, while the part below keeps holding it up.
+
+    enable_sleeping(space)
+    freezer = BodyFreezer()
+    while running:
+        loop.advance(frame_time)
+        if freezer.due(loop.steps):
+            freezer.update(space, bricks)
+
+    def brick_ball_collide(space, bricks, balls, energies):
+        freezer.thaw_hit(space, bricks, balls)
+
+Changing a body's type is not allowed inside the step, so update() and
+thaw() are called between steps, e.g. from a post-step
+callback such as CollisionEvents.
+"""
+import pymunk
+
+SLEEP_TIME_THRESHOLD = 0.5  # Seconds an island stays idle before it sleeps
+IDLE_SPEED_THRESHOLD = 10.0  # Speed under which a body counts as idle
+FREEZE_AFTER_STEPS = 360  # Steps a body stays asleep before it is frozen
+CHECK_PERIOD_STEPS = 30  # Steps between freeze checks
+THAW_ENERGY = 2000.0  # Kinetic energy of a hitting body that thaws what it hits
+CONTACT_PADDING = 1.0  # Gap within which frozen bodies count as touching, for thaw()
+
+
+def enable_sleeping(space, enabled=True, time_threshold=SLEEP_TIME_THRESHOLD,
+                    idle_speed_threshold=IDLE_SPEED_THRESHOLD):
+    """Turns pymunk's sleeping on or off for space, turning it off wakes every body."""
+    space.idle_speed_threshold = idle_speed_threshold if enabled else 0.0
+    space.sleep_time_threshold = time_threshold if enabled else float("inf")
+    if not enabled:
+        for body in space.bodies:
+            if body.body_type == pymunk.Body.DYNAMIC:
+                body.activate()
+
+
+def set_body_type(space, bodies, body_type):
+    """
+    Changes the type of bodies in space.
+
+    Chipmunk can crash changing the type of a sleeping body in place, so they are taken out of the space, changed and
+    added back, with one call each way.
+    """
+    if not bodies:
+        return
+    shapes = [shape for body in bodies for shape in body.shapes]
+    space.remove(*shapes, *bodies)
+    for body in bodies:
+        # Mass and moment come back from the shapes, when made dynamic.
+        body.body_type = body_type
+    space.add(*bodies, *shapes)
+
+
+class BodyFreezer:
+    def __init__(self, freeze_after=FREEZE_AFTER_STEPS, check_period=CHECK_PERIOD_STEPS, thaw_energy=THAW_ENERGY):
+        self.freeze_after = freeze_after
+        self.check_period = check_period
+        self.thaw_energy = thaw_energy
+        self.idle = {}  # Steps asleep of each sleeping body, as of the last check
+        self.frozen = {}  # Frozen bodies, in the order they were frozen
+        self.unchecked_steps = 0
+
+        # Counts of the bodies given to the last check.
+        self.awake = 0
+        self.sleeping = 0
+
+        self.freezes = 0
+        self.thaws = 0
+
+    def due(self, steps):
+        """
+        Counts steps run since the last check, so callers only gather the bodies for update() when it will check them.
+
+        :return: True once check_period steps have run.
+        """
+        self.unchecked_steps += steps
+        return self.unchecked_steps >= self.check_period
+
+    def update(self, space, bodies, steps=0):
+        """
+        Freezes the bodies that have been asleep for freeze_after steps, checked every check_period steps.
+
+        :param bodies: Every body that may be frozen, dynamic or already frozen.
+        :param steps: Steps run since the last update() or due().
+        :return: Number of bodies frozen.
+        """
+        if not self.due(steps):
+            return 0
+        elapsed, self.unchecked_steps = self.unchecked_steps, 0
+
+        idle = {}
+        frozen = {}
+        freeze = []
+        awake = 0
+        for body in bodies:
+            if body.body_type == pymunk.Body.STATIC:
+                frozen[body] = None
+            elif not body.is_sleeping:
+                awake += 1
+            else:
+                steps_asleep = self.idle.get(body, 0) + elapsed
+                if steps_asleep >= self.freeze_after:
+                    freeze.append(body)
+                else:
+                    idle[body] = steps_asleep
+        # Every body of an island is decided before any is frozen, since freezing one wakes the rest.
+        set_body_type(space, freeze, pymunk.Body.STATIC)
+        for body in freeze:
+            frozen[body] = None
+
+        self.idle = idle
+        self.frozen = frozen
+        self.awake = awake
+        self.sleeping = len(idle)
+        self.freezes += len(freeze)
+        return len(freeze)
+
+    def thaw(self, space, bodies):
+        """
+        Makes frozen bodies dynamic again, with the frozen bodies resting on them, and so on.
+
+        A body rests on another when they touch and it is the further one against gravity.
+
+        :return: Number of bodies thawed.
+        """
+        queue = [body for body in bodies if body in self.frozen]
+        thawed = []
+        while queue:
+            body = queue.pop()
+            if body not in self.frozen:
+                continue
+            del self.frozen[body]
+            if body.space is not space or body.body_type != pymunk.Body.STATIC:
+                continue  # Removed, or recycled, since it was frozen
+            thawed.append(body)
+            for shape in body.shapes:
+                bb = shape.bb
+                touching = pymunk.BB(bb.left - CONTACT_PADDING, bb.bottom - CONTACT_PADDING,
+                                     bb.right + CONTACT_PADDING, bb.top + CONTACT_PADDING)
+                queue.extend(other.body for other in space.bb_query(touching, pymunk.ShapeFilter())
+                             if other.body in self.frozen
+                             and (other.body.position - body.position).dot(space.gravity) < 0)
+        set_body_type(space, thawed, pymunk.Body.DYNAMIC)
+        self.thaws += len(thawed)
+        return len(thawed)
+
+    def thaw_hit(self, space, shapes_a, shapes_b):
+        """
+        Thaws the frozen shapes of collisions where the other body hit with at least thaw_energy.
+
+        :param shapes_a: Shapes of each collision, as passed to a CollisionEvents process function.
+        :param shapes_b: The shapes they collided with.
+        :return: Number of bodies thawed.
+        """
+        if not self.frozen:
+            return 0
+        hit = []
+        for shape_a, shape_b in zip(shapes_a, shapes_b):
+            for shape, other in ((shape_a, shape_b), (shape_b, shape_a)):
+                if shape.body in self.frozen and other.body.kinetic_energy >= self.thaw_energy:
+                    hit.append(shape.body)
+        return self.thaw(space, hit) if hit else 0
+
+    def thaw_all(self, space):
+        return self.thaw(space, list(self.frozen))
+
+    def clear(self):
+        """Forgets every body, e.g. once they are all removed from the space."""
+        self.idle.clear()
+        self.frozen.clear()
+        self.unchecked_steps = 0
+        self.awake = self.sleeping = 0
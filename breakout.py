@@ -14,7 +14,21 @@ import pymunk
 import pymunk.pygame_util
 from pymunk import Vec2d
 
+from collision_events import CollisionEvents
+from frame_profiler import FrameProfiler
+from game_loop import FixedTimestep
+from session_record import capture_state
+from sprite_renderer import SpriteRenderer
+from text_cache import TextCache, compose_text
+
 width, height = 600, 600
+fps = 60
+debug_capture_state = False
+profile = False  # Starts with the frame profiler overlay shown, F3 toggles it
+profile_trace = None  # File the profiler trace is written to on exit, .csv or .json
+profiler = FrameProfiler(1000 / fps, profile)
+text_cache = TextCache()
+collisions = None
 
 
 collision_types = {
@@ -45,6 +59,23 @@ def spawn_ball(space, position, direction):
     space.add(ball_body, ball_shape)
 
 
+def remove_shapes(space, shapes):
+    """Removes shapes and their bodies with a single call, skipping any already removed."""
+    # Collisions come in the order of Chipmunk's pointer hashes, which changes from run to run. Removed in order of
+    # position instead, the same game plays out the same way every time.
+    shapes = sorted((shape for shape in dict.fromkeys(shapes) if shape.space is space),
+                    key=lambda shape: tuple(shape.body.position))
+    space.remove(*shapes, *(shape.body for shape in shapes))
+
+
+def remove_bricks(space, bricks, balls, energies):
+    remove_shapes(space, bricks)
+
+
+def remove_balls(space, balls, bottoms, energies):
+    remove_shapes(space, balls)
+
+
 def setup_level(space, player_body):
 
     # Remove balls and bricks
@@ -71,26 +102,19 @@ def setup_level(space, player_body):
             brick_shape.collision_type = collision_types["brick"]
             space.add(brick_body, brick_shape)
 
-    # Make bricks be removed when hit by ball
-    def remove_brick(arbiter, space, data):
-        brick_shape = arbiter.shapes[0]
-        space.remove(brick_shape, brick_shape.body)
+    # Make bricks be removed when hit by ball, after the step
+    collisions.on(collision_types["brick"], collision_types["ball"], remove_bricks, "separate")
 
-    h = space.add_collision_handler(collision_types["brick"], collision_types["ball"])
-    h.separate = remove_brick
 
+def create_space(threaded=False):
+    """
+    Builds the walls, paddle and first level.
 
-def main():
-    ### PyGame init
-    pygame.init()
-    screen = pygame.display.set_mode((width, height))
-    clock = pygame.time.Clock()
-    running = True
-    font = pygame.font.SysFont("Arial", 16)
-    ### Physics stuff
-    space = pymunk.Space()
-    pymunk.pygame_util.positive_y_is_up = True
-    draw_options = pymunk.pygame_util.DrawOptions(screen)
+    :return: (space, player_body)
+    """
+    space = pymunk.Space(threaded=threaded)
+    global collisions
+    collisions = CollisionEvents(space, profiler.count)
 
     ### Game area
     # walls - the left-top-right walls
@@ -111,13 +135,7 @@ def main():
     bottom.collision_type = collision_types["bottom"]
     bottom.color = pygame.Color("red")
 
-    def remove_first(arbiter, space, data):
-        ball_shape = arbiter.shapes[0]
-        space.remove(ball_shape, ball_shape.body)
-        return True
-
-    h = space.add_collision_handler(collision_types["ball"], collision_types["bottom"])
-    h.begin = remove_first
+    collisions.on(collision_types["ball"], collision_types["bottom"], remove_balls)
     space.add(bottom)
 
     ### Player ship
@@ -145,16 +163,36 @@ def main():
         return True
 
     h = space.add_collision_handler(collision_types["player"], collision_types["ball"])
-    h.pre_solve = pre_solve
+    h.pre_solve = profiler.counted(pre_solve)
 
     # restrict movement of player to a straigt line
     move_joint = pymunk.GrooveJoint(
         space.static_body, player_body, (100, 100), (500, 100), (0, 0)
     )
     space.add(player_body, player_shape, move_joint)
-    global state
     # Start game
     setup_level(space, player_body)
+    return space, player_body
+
+
+def main():
+    ### PyGame init
+    pygame.init()
+    screen = pygame.display.set_mode((width, height))
+    clock = pygame.time.Clock()
+    running = True
+    font = pygame.font.SysFont("Arial", 16)
+    ### Physics stuff
+    space, player_body = create_space()
+    pymunk.pygame_util.positive_y_is_up = True
+    renderer = SpriteRenderer(space)
+    help_layer = compose_text(font, [
+        ("Move with left/right arrows, space to spawn a ball", (5, height - 35)),
+        ("Press R to reset, ESC or Q to quit, F3 to profile", (5, height - 20)),
+    ], pygame.Color("darkgrey"), (width, height))
+    global state
+    loop = FixedTimestep(space, step_rate=fps)
+    frame_time = 0.0
 
     while running:
         for event in pygame.event.get():
@@ -166,6 +204,8 @@ def main():
                 running = False
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
                 pygame.image.save(screen, "breakout.png")
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                profiler.toggle()
 
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_LEFT:
                 player_body.velocity = (-600, 0)
@@ -185,45 +225,40 @@ def main():
                     player_body.position + (0, 40),
                     random.choice([(1, 10), (-1, 10)]),
                 )
+        profiler.lap("events")
+
+        ### Update physics
+        loop.advance(frame_time)
+        profiler.lap("physics")
 
         ### Clear screen
         screen.fill(pygame.Color("black"))
 
         ### Draw stuff
-        space.debug_draw(draw_options)
+        renderer.draw(screen, *loop.state())
+        profiler.lap("draw")
 
-        state = []
-        for x in space.shapes:
-            s = "%s %s %s" % (x, x.body.position, x.body.velocity)
-            state.append(s)
-
-        ### Update physics
-        fps = 60
-        dt = 1.0 / fps
-        space.step(dt)
+        if debug_capture_state:
+            state = capture_state(space)
+            profiler.lap("state")
 
         ### Info and flip screen
         screen.blit(
-            font.render("fps: " + str(clock.get_fps()), 1, pygame.Color("white")),
+            text_cache.render(font, f"fps: {clock.get_fps():.0f}", pygame.Color("white")),
             (0, 0),
         )
-        screen.blit(
-            font.render(
-                "Move with left/right arrows, space to spawn a ball",
-                1,
-                pygame.Color("darkgrey"),
-            ),
-            (5, height - 35),
-        )
-        screen.blit(
-            font.render(
-                "Press R to reset, ESC or Q to quit", 1, pygame.Color("darkgrey")
-            ),
-            (5, height - 20),
-        )
+        screen.blit(help_layer, (0, 0))
+        profiler.draw(screen, (5, 20), font)
+        profiler.lap("hud")
 
         pygame.display.flip()
-        clock.tick(fps)
+        profiler.lap("flip")
+        frame_time = clock.tick(fps) / 1000
+        profiler.lap("wait")
+        profiler.end_frame()
+
+    if profile_trace:
+        profiler.dump(profile_trace)
 
 
 if __name__ == "__main__":
@@ -1,16 +1,32 @@
+import argparse
+import json
+import math
 import random
 import sys
 import time
+from collections import deque
 from enum import Enum
 from enum import auto
 from typing import Union, Tuple
 
+import numpy as np
 import pygame
 import pymunk
 import pymunk.pygame_util
 from pymunk import Vec2d
 from pygame.locals import RESIZABLE
 
+from body_freezer import BodyFreezer, enable_sleeping
+from camera import Camera
+from collision_events import CollisionEvents
+from entity_store import EntityStore
+from frame_profiler import FrameProfiler
+from game_loop import FixedTimestep
+from sound_dispatch import SoundDispatcher
+from session_record import Keyframe, SessionRecorder, capture_state, read_session
+from sprite_renderer import SpriteRenderer
+from text_cache import TextCache, compose_text
+
 """
 Ideas
 - stochastic golf
@@ -20,8 +36,6 @@ Improvements
 - modularize the entities and behaviors
   entities: make it possible to spawn balls from arbitrary locations
   behaviors: make it possible to attach player-movement to the balls, or the bricks
-- Camera system
-  HOWTO https://www.phind.com/search?cache=3dd266e2-5e53-4944-889f-4e84ba9141ff
 """
 
 PYGAME_COLOR_WHITE = pygame.Color("white")
@@ -32,6 +46,8 @@ DEFAULT_DIRECTION = 1000, 600
 DIRECTION_TILT_RANGE_TUPLE = (-300, 300)
 DRAW_FPS = True
 TARGET_FPS = 120
+PHYSICS_RATE = 120  # Fixed physics steps per second, independent of the frame rate
+PHYSICS_SUB_STEPS = 1
 COLLISION_TYPES = {
     "ball": 1,
     "brick": 2,
@@ -41,10 +57,25 @@ BALL_ELASTICITY = 0.7
 BRICK_ELASTICITY = 0.0000001
 CULL_PERIOD_SEC = 1.0
 CULL_POSITION = 10 * WIDTH  # NOTE: Removes any physics bodies positioned outside this coordinate (x or y)
+CULL_BUDGET_SEC = 0.002  # Time per frame spent removing culled bodies, the rest wait for the next frame
+REMOVE_BATCH_SIZE = 64
+POOL_CAP = 4096  # Most recycled bodies kept per kind, beyond this culled bodies are freed
+BALL_RADIUS = 5
+BALL_MASS = 1
+BURST_BALLS = 1000  # Balls fired at once by [B]
+IMPACT_CHANNELS = 16  # Mixer channels reserved for collision sounds, out of 32
+BRICK_SIZE = 40, 20
 DEBUG_LOG = False
 DEBUG_CAPTURE_STATE = False
+PROFILE = False  # Starts with the frame profiler overlay shown, [F3] toggles it
+PROFILE_TRACE = None  # File the profiler trace is written to on exit, .csv or .json
 RANDOMIZE_BALL_SIZE = False
+SLEEP_MODE = False  # Lets resting piles sleep and freezes long-idle bricks, [Z] toggles it
 MOVE_DAMPEN_FACTOR = 0.9
+CAMERA_ZOOM_KEYS = {pygame.K_EQUALS: 1, pygame.K_PLUS: 1, pygame.K_KP_PLUS: 1, pygame.K_MINUS: -1,
+                    pygame.K_KP_MINUS: -1}
+GRAVITY = 0, 900
+DAMPING = 0.5
 
 
 class EventState(Enum):
@@ -59,137 +90,260 @@ class EventState(Enum):
     SpawnBall = auto()
     SpawnBricks = auto()
     Debug = auto()
+    Profile = auto()
+    Cull = auto()
+    SpawnBurst = auto()
+    Sleep = auto()
 
 
 DEFAULT_DRAWABLE_COLOR = pygame.color.THECOLORS.get("magenta")
 
 
 class Drawable:
+    __slots__ = ("position",)
+
     def __init__(self, position=(0, 0)):
         self.position = position
 
-    def draw(self, surface: pygame.Surface):
-        pygame.draw.line(surface, DEFAULT_DRAWABLE_COLOR,
-                         (self.position[0] - 10, self.position[1] - 10),
-                         (self.position[0] + 10, self.position[1] + 10))
-        pygame.draw.line(surface, DEFAULT_DRAWABLE_COLOR,
-                         (self.position[0] + 10, self.position[1] - 10),
-                         (self.position[0] - 10, self.position[1] + 10))
+    def draw(self, surface: pygame.Surface, camera=None):
+        x, y = self.position if camera is None else camera.to_screen(self.position)
+        pygame.draw.line(surface, DEFAULT_DRAWABLE_COLOR, (x - 10, y - 10), (x + 10, y + 10))
+        pygame.draw.line(surface, DEFAULT_DRAWABLE_COLOR, (x + 10, y - 10), (x - 10, y + 10))
 
 
 class Player(Drawable):
+    __slots__ = ()
+
     def __init__(self, position=(0, 0)):
         super().__init__(position)
 
 
-space = None
-state = []
-drawables = []
-sfx = {}
-ball_count = 0
-player = Player()
+class BodyPool:
+    """
+    Recycles the bodies of one kind, with their shapes, instead of allocating new ones.
+
+    Released bodies keep their shapes and shape properties and acquire() resets
+    their motion. At most cap bodies are held, extra ones are left to be freed.
+    """
+
+    def __init__(self, create, cap=POOL_CAP):
+        """
+        :param create: Returns a new (body, *shapes) when the pool is empty.
+        """
+        self.create = create
+        self.cap = cap
+        self.free = []
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, position):
+        """
+        :return: (body, *shapes) at rest at position, not yet in any space.
+        """
+        if not self.free:
+            self.misses += 1
+            body, *shapes = self.create()
+            body.position = position
+            return body, *shapes
+
+        self.hits += 1
+        body, *shapes = self.free.pop()
+        body.position = position
+        body.velocity = 0, 0
+        body.angle = 0
+        body.angular_velocity = 0
+        body.force = 0, 0
+        body.torque = 0
+        return body, *shapes
+
+    def acquire_many(self, positions, velocities):
+        """
+        Same as acquire() for a number of bodies, moving at velocities rather than at rest.
+
+        :return: List of (body, *shapes).
+        """
+        count = len(positions)
+        recycled = min(count, len(self.free))
+        items = self.free[len(self.free) - recycled:]
+        del self.free[len(self.free) - recycled:]
+        self.hits += recycled
+        self.misses += count - recycled
+        items += [self.create() for _ in range(count - recycled)]
+
+        for (body, *shapes), position, velocity in zip(items, positions.tolist(), velocities.tolist()):
+            body.position = position
+            body.velocity = velocity
+        for body, *shapes in items[:recycled]:
+            # Forces are cleared by every step, only the rotation can be left over.
+            if body.angle or body.angular_velocity:
+                body.angle = 0
+                body.angular_velocity = 0
+        return items
+
+    def release(self, body):
+        if body.body_type != pymunk.Body.DYNAMIC:
+            body.body_type = pymunk.Body.DYNAMIC  # Frozen, see BodyFreezer
+        # Bodies only hold weak references to their shapes, so keep them here.
+        if len(self.free) < self.cap:
+            self.free.append((body, *body.shapes))
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class BodyRegistry:
+    """
+    Tracks the dynamic bodies in the space by kind, e.g. "ball" or "brick", in an EntityStore.
+
+    Out-of-bounds bodies are found from the store's position array, queued,
+    and removed a batch at a time by flush() within a time budget, so large
+    sweeps are spread across frames. Removed bodies go back to the pool of
+    their kind, if it has one.
+    """
+
+    def __init__(self, pools=None):
+        self.pools = {} if pools is None else pools
+        self.entities = EntityStore()
+        self.pending = deque()
+        self.pending_ids = set()
+
+    def add(self, space, kind, body, *shapes):
+        space.add(body, *shapes)
+        color = getattr(shapes[0], "color", DEFAULT_DRAWABLE_COLOR) if shapes else DEFAULT_DRAWABLE_COLOR
+        self.entities.add(body, kind, color)
+
+    def add_many(self, space, kind, items, positions=None, velocities=None):
+        """
+        Adds (body, *shapes) items of one kind with a single space.add call.
+
+        :param positions: Their positions as an array, if known, saves reading them back from the bodies.
+        :param velocities: Same for their velocities.
+        """
+        if not items:
+            return
+        space.add(*(obj for item in items for obj in item))
+        color = getattr(items[0][1], "color", DEFAULT_DRAWABLE_COLOR) if len(items[0]) > 1 else DEFAULT_DRAWABLE_COLOR
+        self.entities.add_many([item[0] for item in items], kind, color, positions, velocities)
+
+    def count(self, kind):
+        return self.entities.count(kind)
+
+    def __len__(self):
+        return len(self.entities)
+
+    def cull(self, limit):
+        """
+        Queues bodies positioned outside +/-limit on either axis for removal.
+
+        Reads the positions from the last EntityStore.sync().
+
+        :return: Number of bodies newly queued.
+        """
+        count = 0
+        for entity in self.entities.outside(limit).tolist():
+            body = self.entities.bodies[entity]
+            if body.id in self.pending_ids:
+                continue
+            self.pending.append(body)
+            self.pending_ids.add(body.id)
+            count += 1
+        return count
+
+    def flush(self, space, budget=CULL_BUDGET_SEC, limit=None):
+        """
+        Removes queued bodies in batches until the queue is empty or the budget is spent.
+
+        :param limit: Removes this many bodies, or every queued one if fewer, however long it takes. For replays.
+        :return: Number of bodies removed.
+        """
+        deadline = None if limit is not None else time.perf_counter() + budget
+        limit = len(self.pending) if limit is None else min(limit, len(self.pending))
+        count = 0
+        while count < limit and (deadline is None or count == 0 or time.perf_counter() < deadline):
+            batch = [self.pending.popleft() for _ in range(min(REMOVE_BATCH_SIZE, limit - count))]
+            self.pending_ids.difference_update(body.id for body in batch)
+            count += self.remove(space, batch)
+        return count
+
+    def remove(self, space, bodies):
+        """Removes bodies and their shapes from the space with a single call."""
+        items = []
+        removed = []
+        for body in bodies:
+            entity = self.entities.entity_of(body)
+            if entity is None:
+                continue
+            kind = self.entities.kind_names[self.entities.kinds[entity]]
+            self.entities.remove(entity)
+            items.append(body)
+            items.extend(body.shapes)
+            removed.append((kind, body))
+        if items:
+            space.remove(*items)
+        for kind, body in removed:
+            if kind in self.pools:
+                self.pools[kind].release(body)
+        return len(bodies)
+
+    def clear(self, space):
+        """Removes every registered body at once."""
+        self.pending.clear()
+        self.pending_ids.clear()
+        self.remove(space, [body for body in self.entities.bodies if body is not None])
+
+
 DEFAULT_MUTE = False
 
 
 class BlindSound:
     mute = DEFAULT_MUTE
 
-    def __init__(self, filename):
+    def __init__(self, filename, load=True, counter=None):
+        """
+        :param counter: Called with ("sound plays", 1) when the sound plays, e.g. FrameProfiler.count.
+        """
         self.sound = None
+        self.counter = counter
+        if not load:
+            return
         try:
             self.sound = pygame.mixer.Sound(filename)
         except FileNotFoundError:
             print(f"BlindSound: unable to load file: {filename}")
             pass
 
-    def play(self, loops=0, maxtime=0, fade_ms=0):
-        if self.mute is True:
-            return
-        if self.sound is not None:
+    def play(self, loops=0, maxtime=0, fade_ms=0, channel=None):
+        """
+        :param channel: Plays on this mixer channel, rather than any free one.
+        :return: True if the sound played.
+        """
+        if self.mute is True or self.sound is None:
+            return False
+        if channel is None:
             self.sound.play(loops, maxtime, fade_ms)
+        else:
+            channel.play(self.sound, loops, maxtime, fade_ms)
+        if self.counter is not None:
+            self.counter("sound plays", 1)
+        return True
 
     def set_volume(self, value):
         if self.sound is not None:
             self.sound.set_volume(value)
 
 
-def load_sfx():
-    pygame.mixer.set_num_channels(32)
-
-    global sfx
-    sfx = {
-        "brick": {
-            "impact": [
-                BlindSound("sfx/brick_sounds/impact/brick_impact_01.mp3"),
-                BlindSound("sfx/brick_sounds/impact/brick_impact_03.mp3")
-            ],
-            "scrape": [
-                BlindSound("sfx/brick_sounds/scrape/brick_scrape_02.mp3"),
-            ]
-        },
-        "ball": {
-            "bounce": [
-                BlindSound("sfx/ball_sounds/bounce/rubber_ball_bounce_cement_04.wav"),
-            ],
-            "catch": [
-                BlindSound("sfx/ball_sounds/catch/rubber_ball_catch_03.mp3"),
-            ]
-        }
-    }
-
-    sfx["brick"]["scrape"][0].set_volume(0.5)
-
-
-def setup_level(space):
-    """
-    Populate with initial components
-    :param space:
-    """
-    remove_balls_bricks(space)
-
-    player.position = DEFAULT_POSITION
-    drawables.append(player)
-
-    fire_ball(space, player.position)
-
-    # Spawn bricks
-
-    one_brick = False
-    if one_brick:
-        brick_body = pymunk.Body(body_type=pymunk.Body.DYNAMIC)
-        brick_body.position = 400, 300
-
-        brick_shape = pymunk.Poly.create_box(brick_body, (20, 10))
-        brick_shape.color = pygame.Color("brown")
-        brick_shape.mass = 1
-
-        space.add(brick_body, brick_shape)
-    else:
-        spawn_bricks(space)
-
-    handle_brick_brick = space.add_collision_handler(COLLISION_TYPES["brick"], COLLISION_TYPES["brick"])
-    handle_brick_brick.begin = brick_brick_collide
+def create_space(threaded=False):
+    space = pymunk.Space(threaded=threaded)
+    space.gravity = GRAVITY
+    space.damping = DAMPING
+    return space
 
-    handle_brick_ball = space.add_collision_handler(COLLISION_TYPES["brick"], COLLISION_TYPES["ball"])
-    handle_brick_ball.begin = brick_ball_collide
 
-    spawn_walls(space)
-
-
-def spawn_ball(space: pymunk.Space, position: Union[Vec2d, Tuple[float, float]], direction):
-    ball_body = pymunk.Body(1, float("inf"))
-    ball_body.position = position
-
-    ball_shape = create_ball_shape(ball_body, 5)
-
-    ball_body.apply_impulse_at_local_point(Vec2d(*direction), (1, 1))
-
-    space.add(ball_body, ball_shape)
-
-    sfx["ball"]["catch"][0].play()
-
-    global ball_count
-    ball_count += 1
+def create_ball():
+    ball_body = pymunk.Body(BALL_MASS, float("inf"))
+    return ball_body, create_ball_shape(ball_body, BALL_RADIUS)
 
 
 def create_ball_shape(ball_body, radius):
@@ -200,189 +354,419 @@ def create_ball_shape(ball_body, radius):
     return ball_shape
 
 
-def spawn_walls(space):
-    line_radius = 20
-    wall_left = 50
-    wall_right = WIDTH - 50
-    wall_top = 50
-    wall_bottom = HEIGHT - 50
-    static_lines = [
-        pymunk.Segment(space.static_body, (wall_left, wall_bottom - 25),
-                       (wall_right, wall_bottom + 25), line_radius),  # Bottom
-        pymunk.Segment(space.static_body, (wall_left, wall_top),
-                       (wall_right, wall_top), line_radius),  # Bottom
-    ]
-    for line in static_lines:
-        line.color = pygame.Color("orange")
-        line.elasticity = 1.0
-        line.friction = 0.62
-        line.collision_type = COLLISION_TYPES["wall"]
-    space.add(*static_lines)
-    handle_wall_ball = space.add_collision_handler(COLLISION_TYPES["wall"], COLLISION_TYPES["ball"])
-    handle_wall_ball.begin = wall_ball_collide
-    handle_wall_ball = space.add_collision_handler(COLLISION_TYPES["wall"], COLLISION_TYPES["brick"])
-    handle_wall_ball.begin = wall_brick_collide
-
-
-def spawn_bricks(space):
-    brick_w = 40
-    brick_height = 20
-    brick_pad = 2
-
-    for x in range(6, 8):
-        x = x * (brick_w + brick_pad) + 100 + brick_height
-        for y in range(0, 4):
-            y = y * (brick_height + brick_pad) + 100 + brick_height
-            brick_body = pymunk.Body(body_type=pymunk.Body.DYNAMIC)
-            brick_body.position = x, y
-            brick_shape = pymunk.Poly.create_box(brick_body, (brick_w, brick_height))
-            brick_shape.color = pygame.Color("brown")
-            brick_shape.group = 1
-            brick_shape.collision_type = COLLISION_TYPES["brick"]
-            brick_shape.mass = 1
-            brick_shape.elasticity = BRICK_ELASTICITY
-            brick_shape.friction = 0.62
-            space.add(brick_body, brick_shape)
+def create_brick():
+    brick_body = pymunk.Body(body_type=pymunk.Body.DYNAMIC)
+    brick_shape = pymunk.Poly.create_box(brick_body, BRICK_SIZE)
+    brick_shape.color = pygame.Color("brown")
+    brick_shape.group = 1
+    brick_shape.collision_type = COLLISION_TYPES["brick"]
+    brick_shape.mass = 1
+    brick_shape.elasticity = BRICK_ELASTICITY
+    brick_shape.friction = 0.62
+    return brick_body, brick_shape
 
 
-def remove_balls_bricks(space):
-    for s in space.shapes[:]:
-        if s.body.body_type == pymunk.Body.DYNAMIC:
-            space.remove(s.body, s)
+def burst_positions(center, count):
+    """
+    Positions for count balls packed in a square around center, as a (count, 2) array.
 
+    Balls spawned on top of each other would all collide with each other on the next step.
+    """
+    side = math.ceil(math.sqrt(count))
+    spacing = 2 * BALL_RADIUS + 1
+    offsets = (np.indices((side, side)).reshape(2, -1).T[:count] - (side - 1) / 2) * spacing
+    return np.asarray(center, dtype=float) + offsets
 
-def brick_brick_collide(arbiter, space, data):
-    if arbiter.shapes[0].body.kinetic_energy > 40000:
-        c = sfx["brick"]["impact"][0].play()
-    elif arbiter.shapes[0].body.kinetic_energy > 10000:
-        c = sfx["brick"]["impact"][1].play()
-    elif arbiter.shapes[0].body.kinetic_energy > 500:
-        c = sfx["brick"]["scrape"][0].play()
-    return True
 
+HUD_STATIC_LINES = [
+    ("BRICK_KNOCKER", (WIDTH - 150, 0)),
+    ("[Wheel] or [+]/[-] to zoom, drag with the right button to pan, [C] to recenter", (5, HEIGHT - 65)),
+    ("[K] to spawn more bricks, add [Shift] to spray", (5, HEIGHT - 50)),
+    ("[Space] to spawn a ball, add [Shift] to spray, [B] for a burst. Arrows to move.", (5, HEIGHT - 35)),
+    ("[R] to reset, [ESC] or [Q] to quit, [M] to mute, [F3] to profile, [Z] to let piles sleep", (5, HEIGHT - 20)),
+]
 
-def brick_ball_collide(arbiter, space, data):
-    if arbiter.shapes[1].body.kinetic_energy > 40000:
-        c = sfx["ball"]["bounce"][0].play()
-    return True
 
+def toggle_mute():
+    BlindSound.mute = not BlindSound.mute
 
-def wall_ball_collide(arbiter, space, data):
-    if arbiter.shapes[1].body.kinetic_energy > 100000:
-        c = sfx["ball"]["bounce"][0].play()
-    return True
 
+def debug_print(self, *args):
+    if DEBUG_LOG:
+        print(self, args)
 
-def wall_brick_collide(arbiter, space, data):
-    if arbiter.shapes[1].body.kinetic_energy > 100000:
-        c = sfx["brick"]["impact"][0].play()
-    elif arbiter.shapes[1].body.kinetic_energy > 500:
-        c = sfx["brick"]["scrape"][0].play()
-    return True
 
+class BrickKnocker:
+    """
+    The state of one game: its space, the bodies in it, the player, sounds, view and profiler.
 
-def fire_ball(space, position):
-    tilt = random.randrange(*DIRECTION_TILT_RANGE_TUPLE)
-    ball_direction = (DEFAULT_DIRECTION[0], DEFAULT_DIRECTION[1] + tilt)
-    if position is None:
-        position = DEFAULT_POSITION
-    spawn_ball(
-        space,
-        position,
-        ball_direction,
-    )
+    main() builds one to play and replay() one to run a recording headless.
+    The bodies' positions, angles and velocities are read once a frame into
+    bodies.entities, see EntityStore.sync, and both the game and the drawing
+    work from there.
+    """
 
+    def __init__(self, space, sleep_mode=None, camera=None):
+        """
+        :param space: Space to play in, see create_space().
+        :param sleep_mode: Lets resting piles sleep and freezes long-idle bricks, see set_sleep_mode(). Defaults to
+            SLEEP_MODE.
+        :param camera: View to draw through and to pan and zoom from the input, None for none.
+        """
+        self.space = space
+        self.camera = camera
+        self.state = []
+        self.drawables = []
+        self.player = Player()
+        self.pools = {"ball": BodyPool(create_ball), "brick": BodyPool(create_brick)}
+        self.bodies = BodyRegistry(self.pools)
+        self.sfx = {}
+        self.text_cache = TextCache()
+        self.hud_layer = None
+        self.profiler = FrameProfiler(1000 / TARGET_FPS, PROFILE)
+        self.audio = SoundDispatcher(counter=self.profiler.count)
+        self.collisions = CollisionEvents(space, self.profiler.count)
+        self.freezer = BodyFreezer()
+        self.sleep_mode = SLEEP_MODE if sleep_mode is None else sleep_mode
+        enable_sleeping(space, self.sleep_mode)
+
+    def load_sfx(self, load=True):
+        """
+        :param load: False fills in silent sounds without touching the mixer, for running headless.
+        """
+        if load:
+            pygame.mixer.set_num_channels(32)
+            self.audio.reserve(IMPACT_CHANNELS)
+
+        def sound(filename):
+            return BlindSound(filename, load, self.profiler.count)
+
+        self.sfx = {
+            "brick": {
+                "impact": [
+                    sound("sfx/brick_sounds/impact/brick_impact_01.mp3"),
+                    sound("sfx/brick_sounds/impact/brick_impact_03.mp3")
+                ],
+                "scrape": [
+                    sound("sfx/brick_sounds/scrape/brick_scrape_02.mp3"),
+                ]
+            },
+            "ball": {
+                "bounce": [
+                    sound("sfx/ball_sounds/bounce/rubber_ball_bounce_cement_04.wav"),
+                ],
+                "catch": [
+                    sound("sfx/ball_sounds/catch/rubber_ball_catch_03.mp3"),
+                ]
+            }
+        }
 
-def draw_hud(clock, font, screen):
-    if DRAW_FPS is True:
-        blit_text(font, screen, "fps: " + str(clock.get_fps()), (0, 0))
-    blit_text(font, screen, f"Balls: {ball_count}", (0, 15))
+        self.sfx["brick"]["scrape"][0].set_volume(0.5)
 
-    blit_text(font, screen, "BRICK_KNOCKER", (WIDTH - 150, 0))
-    blit_text(font, screen, "[K] to spawn more bricks, add [Shift] to spray", (5, HEIGHT - 50))
-    blit_text(font, screen, "[Space] to spawn a ball, add [Shift] to spray. Arrows to move.", (5, HEIGHT - 35))
-    blit_text(font, screen, "[R] to reset, [ESC] or [Q] to quit, [M] to mute", (5, HEIGHT - 20))
+    def setup_level(self):
+        """
+        Populate with initial components
+        """
+        space = self.space
+        self.remove_balls_bricks()
 
+        self.player.position = DEFAULT_POSITION
+        self.drawables.append(self.player)
 
-def draw_window(surface: pygame.Surface):
-    for d in drawables:
-        d.draw(surface)
+        self.fire_ball(self.player.position)
 
+        # Spawn bricks
 
-def blit_text(font, screen, text, position):
-    screen.blit(font.render(text, True, FONT_COLOR), position)
+        one_brick = False
+        if one_brick:
+            brick_body = pymunk.Body(body_type=pymunk.Body.DYNAMIC)
+            brick_body.position = 400, 300
 
+            brick_shape = pymunk.Poly.create_box(brick_body, (20, 10))
+            brick_shape.color = pygame.Color("brown")
+            brick_shape.mass = 1
 
-def cleanup_bodies(space):
-    count = 0
-    for s in space.shapes[:]:
-        if s.body.body_type == pymunk.Body.DYNAMIC and (
-                abs(s.body.position.y) > CULL_POSITION or abs(s.body.position.x > CULL_POSITION)
-        ):
-            space.remove(s.body, s)
-            count += 1
-    debug_print(f"Cleaned up {count} bodies")
+            space.add(brick_body, brick_shape)
+        else:
+            self.spawn_bricks()
+
+        events = self.collisions
+        events.on(COLLISION_TYPES["brick"], COLLISION_TYPES["brick"], self.brick_brick_collide, energy_shape=0)
+        events.on(COLLISION_TYPES["brick"], COLLISION_TYPES["ball"], self.brick_ball_collide, energy_shape=1)
+
+        self.spawn_walls()
+
+    def spawn_ball(self, position: Union[Vec2d, Tuple[float, float]], direction):
+        self.spawn_balls([position], [direction])
+
+    def spawn_balls(self, positions, directions):
+        """
+        Spawns a ball at each position, given an impulse in its direction.
+
+        The balls are added with a single space.add call and the catch sound plays once, whatever the number of balls.
+
+        :param positions: (balls, 2) array-like.
+        :param directions: (balls, 2) array-like of impulses.
+        """
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        # An impulse through the center of a ball that cannot rotate only changes its velocity.
+        velocities = np.asarray(directions, dtype=float).reshape(-1, 2) / BALL_MASS
+        items = self.pools["ball"].acquire_many(positions, velocities)
+        for ball_body, ball_shape in items:
+            if ball_shape.radius != BALL_RADIUS:
+                ball_shape.unsafe_set_radius(BALL_RADIUS)
+
+        self.bodies.add_many(self.space, "ball", items, positions, velocities)
+
+        if items:
+            self.sfx["ball"]["catch"][0].play()
+
+    def spawn_walls(self):
+        space = self.space
+        line_radius = 20
+        wall_left = 50
+        wall_right = WIDTH - 50
+        wall_top = 50
+        wall_bottom = HEIGHT - 50
+        static_lines = [
+            pymunk.Segment(space.static_body, (wall_left, wall_bottom - 25),
+                           (wall_right, wall_bottom + 25), line_radius),  # Bottom
+            pymunk.Segment(space.static_body, (wall_left, wall_top),
+                           (wall_right, wall_top), line_radius),  # Bottom
+        ]
+        for line in static_lines:
+            line.color = pygame.Color("orange")
+            line.elasticity = 1.0
+            line.friction = 0.62
+            line.collision_type = COLLISION_TYPES["wall"]
+        space.add(*static_lines)
+        events = self.collisions
+        events.on(COLLISION_TYPES["wall"], COLLISION_TYPES["ball"], self.wall_ball_collide, energy_shape=1)
+        events.on(COLLISION_TYPES["wall"], COLLISION_TYPES["brick"], self.wall_brick_collide, energy_shape=1)
+
+    def spawn_bricks(self):
+        brick_w, brick_height = BRICK_SIZE
+        brick_pad = 2
+
+        for x in range(6, 8):
+            x = x * (brick_w + brick_pad) + 100 + brick_height
+            for y in range(0, 4):
+                y = y * (brick_height + brick_pad) + 100 + brick_height
+                self.bodies.add(self.space, "brick", *self.pools["brick"].acquire((x, y)))
+
+    def remove_balls_bricks(self):
+        self.bodies.clear(self.space)
+        self.freezer.clear()
+
+    def set_sleep_mode(self, enabled):
+        """Turns the sleeping of resting bodies and the freezing of idle bricks on or off."""
+        self.sleep_mode = enabled
+        if not enabled:
+            self.freezer.thaw_all(self.space)
+        enable_sleeping(self.space, enabled)
+
+    def settle_bricks(self, steps):
+        """Freezes the bricks asleep for long enough, after the physics steps of a frame."""
+        if self.sleep_mode and self.freezer.due(steps):
+            entities = self.bodies.entities
+            self.freezer.update(self.space, [entities.bodies[entity] for entity in entities.of_kind("brick").tolist()])
+
+    def submit_impacts(self, energies, levels):
+        """
+        Queues the sounds of a step's impacts with the dispatcher, see SoundDispatcher.
+
+        :param energies: Kinetic energy of each impact.
+        :param levels: (threshold, sound) pairs, highest first. An impact sounds the first threshold it is over.
+        """
+        upper = np.inf
+        for threshold, sound in levels:
+            band = energies[(energies > threshold) & (energies <= upper)]
+            if len(band):
+                # The dispatcher only keeps the loudest impact of each sound.
+                self.audio.submit(sound, float(band.max()))
+            upper = threshold
+
+    # Collisions are recorded during the step and handled together after it, see CollisionEvents.
+    def brick_brick_collide(self, space, bricks, other_bricks, energies):
+        sfx = self.sfx
+        self.freezer.thaw_hit(space, bricks, other_bricks)
+        self.submit_impacts(energies, [(40000, sfx["brick"]["impact"][0]), (10000, sfx["brick"]["impact"][1]),
+                                       (500, sfx["brick"]["scrape"][0])])
+
+    def brick_ball_collide(self, space, bricks, balls, energies):
+        self.freezer.thaw_hit(space, bricks, balls)
+        self.submit_impacts(energies, [(40000, self.sfx["ball"]["bounce"][0])])
+
+    def wall_ball_collide(self, space, walls, balls, energies):
+        self.submit_impacts(energies, [(100000, self.sfx["ball"]["bounce"][0])])
+
+    def wall_brick_collide(self, space, walls, bricks, energies):
+        self.submit_impacts(energies, [(100000, self.sfx["brick"]["impact"][0]), (500, self.sfx["brick"]["scrape"][0])])
+
+    def fire_ball(self, position):
+        if position is None:
+            position = DEFAULT_POSITION
+        self.fire_balls([position])
+
+    def fire_balls(self, positions):
+        """Fires a ball from each position, each with its own random tilt."""
+        count = len(positions)
+        tilts = [random.randrange(*DIRECTION_TILT_RANGE_TUPLE) for _ in range(count)]
+        directions = np.column_stack((np.full(count, DEFAULT_DIRECTION[0]), DEFAULT_DIRECTION[1] + np.array(tilts)))
+        self.spawn_balls(positions, directions)
+
+    def draw_hud(self, clock, font, screen):
+        if self.hud_layer is None:
+            self.hud_layer = compose_text(font, HUD_STATIC_LINES, FONT_COLOR, (WIDTH, HEIGHT))
+        screen.blit(self.hud_layer, (0, 0))
+
+        bodies = self.bodies
+        freezer = self.freezer
+        if DRAW_FPS is True:
+            self.blit_text(font, screen, f"fps: {clock.get_fps():.0f}", (0, 0))
+        self.blit_text(font, screen, f"Balls: {bodies.count('ball')}  Bricks: {bodies.count('brick')}", (0, 15))
+        self.blit_text(font, screen, "Pool hits: " + ", ".join(
+            f"{kind} {pool.hit_rate:.0%}" for kind, pool in self.pools.items()), (0, 30))
+        if self.sleep_mode:
+            self.blit_text(font, screen, f"Bricks awake: {freezer.awake}  Sleeping: {freezer.sleeping}  "
+                                         f"Frozen: {len(freezer.frozen)}", (0, 45))
+        self.profiler.draw(screen, (5, 65), font)
+
+    def draw_window(self, surface: pygame.Surface):
+        for d in self.drawables:
+            d.draw(surface, self.camera)
+
+    def blit_text(self, font, screen, text, position):
+        screen.blit(self.text_cache.render(font, text, FONT_COLOR), position)
+
+    def cleanup_bodies(self):
+        count = self.bodies.cull(CULL_POSITION)
+        debug_print(f"Queued {count} bodies for cleanup")
+
+    def handle_camera_event(self, event):
+        """Pans and zooms the camera. The view is not part of the game, so these are not EventStates."""
+        camera = self.camera
+        if camera is None:
+            return
+        if event.type == pygame.MOUSEWHEEL:
+            camera.zoom_by(event.y)
+        elif event.type == pygame.MOUSEMOTION and event.buttons[2]:
+            camera.pan(-event.rel[0], -event.rel[1])
+        elif event.type == pygame.KEYDOWN and event.key in CAMERA_ZOOM_KEYS:
+            camera.zoom_by(CAMERA_ZOOM_KEYS[event.key])
+        elif event.type == pygame.KEYDOWN and event.key == pygame.K_c:
+            camera.reset()
+
+    def parse_events(self, running):
+        """
+        Extract events from user input. May return multiple events if non-terminal.
+
+        :param running:
+        :return: Terminal events as a single element list. Continuous events in a multiple element list.
+        """
+        result = []
+
+        # Single events
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return [EventState.Stop]  # Terminal
+            elif event.type == pygame.KEYDOWN:
+                if event.key in [pygame.K_ESCAPE, pygame.K_q]:
+                    return [EventState.Stop]  # Terminal
+                elif event.key == pygame.K_r:
+                    return [EventState.Restart]  # Terminal
+                elif event.key == pygame.K_k:
+                    result.append(EventState.SpawnBricks)
+                elif event.key == pygame.K_SPACE:
+                    result.append(EventState.SpawnBall)
+                elif event.key == pygame.K_b:
+                    result.append(EventState.SpawnBurst)
+                elif event.key == pygame.K_d:
+                    result.append(EventState.Debug)
+                elif event.key == pygame.K_m:
+                    result.append(EventState.Mute)
+                elif event.key == pygame.K_F3:
+                    result.append(EventState.Profile)
+                elif event.key == pygame.K_z:
+                    result.append(EventState.Sleep)
+                else:
+                    self.handle_camera_event(event)
+            else:
+                self.handle_camera_event(event)
+
+        # Multi-events
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_LEFT]:
+            result.append(EventState.MoveLeft)
+        if keys[pygame.K_RIGHT]:
+            result.append(EventState.MoveRight)
+        if keys[pygame.K_UP]:
+            result.append(EventState.MoveUp)
+        if keys[pygame.K_DOWN]:
+            result.append(EventState.MoveDown)
+
+        mods = pygame.key.get_mods()
+        if mods & pygame.KMOD_SHIFT:
+            if keys[pygame.K_SPACE]:
+                result.append(EventState.SpawnBall)
+            if keys[pygame.K_k]:
+                result.append(EventState.SpawnBricks)
 
+        return result
 
-def toggle_mute():
-    BlindSound.mute = not BlindSound.mute
+    def handle_events(self, events, move_dir):
+        """
+        Applies the events of a frame to the game.
 
+        :return: (running, move_dir)
+        """
+        running = True
+        player = self.player
+        # TIP: https://learnpython.com/blog/python-match-case-statement/
+        for event in events:
+            match event:
+                case EventState.Run:
+                    pass
+                case EventState.Restart:
+                    self.setup_level()
+                case EventState.Stop:
+                    running = False
+                case EventState.SpawnBall:
+                    self.fire_ball(player.position)
+                case EventState.SpawnBurst:
+                    self.fire_balls(burst_positions(player.position, BURST_BALLS))
+                case EventState.SpawnBricks:
+                    self.spawn_bricks()
+                case EventState.Debug | EventState.Cull:
+                    self.cleanup_bodies()
+                case EventState.Mute:
+                    toggle_mute()
+                case EventState.Profile:
+                    self.profiler.toggle()
+                case EventState.Sleep:
+                    self.set_sleep_mode(not self.sleep_mode)
+                case EventState.MoveUp:
+                    move_dir = move_dir[0] + 0, move_dir[1] - 1
+                case EventState.MoveDown:
+                    move_dir = move_dir[0] + 0, move_dir[1] + 1
+                case EventState.MoveLeft:
+                    move_dir = move_dir[0] - 1, move_dir[1] + 0
+                case EventState.MoveRight:
+                    move_dir = move_dir[0] + 1, move_dir[1] + 0
+        return running, move_dir
 
-def debug_print(self, *args):
-    if DEBUG_LOG:
-        print(self, args)
+    def randomize_ball_sizes(self):
+        def randomize_circle_radius(shape):
+            new_radius = shape.radius + random.uniform(-0.4, 0.4)
+            replace_shape(shape, create_ball_shape(shape.body, new_radius))
+        circles = [shape for shape in self.space.shapes if isinstance(shape, pymunk.shapes.Circle)]
+        list(map(randomize_circle_radius, circles))
 
 
-def parse_events(running, space):
+def main(record=None):
     """
-    Extract events from user input. May return multiple events if non-terminal.
-
-    :param running:
-    :param space:
-    :return: Terminal events as a single element list. Continuous events in a multiple element list.
+    :param record: File to record the session to, for replay().
     """
-    result = []
-
-    # Single events
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            return [EventState.Stop]  # Terminal
-        elif event.type == pygame.KEYDOWN:
-            if event.key in [pygame.K_ESCAPE, pygame.K_q]:
-                return [EventState.Stop]  # Terminal
-            elif event.key == pygame.K_r:
-                return [EventState.Restart]  # Terminal
-            elif event.key == pygame.K_k:
-                result.append(EventState.SpawnBricks)
-            elif event.key == pygame.K_SPACE:
-                result.append(EventState.SpawnBall)
-            elif event.key == pygame.K_d:
-                result.append(EventState.Debug)
-            elif event.key == pygame.K_m:
-                result.append(EventState.Mute)
-
-    # Multi-events
-    keys = pygame.key.get_pressed()
-    if keys[pygame.K_LEFT]:
-        result.append(EventState.MoveLeft)
-    if keys[pygame.K_RIGHT]:
-        result.append(EventState.MoveRight)
-    if keys[pygame.K_UP]:
-        result.append(EventState.MoveUp)
-    if keys[pygame.K_DOWN]:
-        result.append(EventState.MoveDown)
-
-    mods = pygame.key.get_mods()
-    if mods & pygame.KMOD_SHIFT:
-        if keys[pygame.K_SPACE]:
-            result.append(EventState.SpawnBall)
-        if keys[pygame.K_k]:
-            result.append(EventState.SpawnBricks)
-
-    return result
-
-
-def main():
     running = True
 
     # PyGame init
@@ -393,93 +777,156 @@ def main():
 
     clock = pygame.time.Clock()
     font = pygame.font.SysFont("Arial", 16)
-    load_sfx()
 
     # Physics stuff
-    space = pymunk.Space()
-    space.gravity = (0, 900)
-    space.damping = 0.5
+    space = create_space()
+    game = BrickKnocker(space, camera=Camera((w, h), (w / 2, h / 2)))
+    game.load_sfx()
+    player, bodies, profiler, camera = game.player, game.bodies, game.profiler, game.camera
 
     # pymunk.pygame_util.positive_y_is_up = True
-    draw_options = pymunk.pygame_util.DrawOptions(screen)
+    renderer = SpriteRenderer(space)
 
-    global state
+    recorder = None
+    if record:
+        seed = random.randrange(2 ** 32)
+        random.seed(seed)
+        recorder = SessionRecorder(record, game="brick_knocker", seed=seed, step_rate=PHYSICS_RATE,
+                                   sub_steps=PHYSICS_SUB_STEPS, sleep_mode=game.sleep_mode)
 
     # Start game
-    setup_level(space)
+    game.setup_level()
     last_time_culled = 0.0
     move_dir = (0, 0)
+    loop = FixedTimestep(space, PHYSICS_RATE, PHYSICS_SUB_STEPS)
+    frame_time = 0.0
 
     while running:
-        # Cleanup any distant bodies
+        # Cleanup any distant bodies, culling is queued as an event so that recordings replay it
+        events = []
         current_time = time.thread_time()
         if (current_time - last_time_culled) > CULL_PERIOD_SEC:
-            cleanup_bodies(space)
+            events.append(EventState.Cull)
             last_time_culled = current_time
+        removed = bodies.flush(space)
+        profiler.lap("cull")
 
-        # TIP: https://learnpython.com/blog/python-match-case-statement/
-        events = parse_events(running, space)
-        for event in events:
-            match event:
-                case EventState.Run:
-                    pass
-                case EventState.Restart:
-                    setup_level(space)
-                case EventState.Stop:
-                    running = False
-                case EventState.SpawnBall:
-                    fire_ball(space, player.position)
-                case EventState.SpawnBricks:
-                    spawn_bricks(space)
-                case EventState.Debug:
-                    cleanup_bodies(space)
-                case EventState.Mute:
-                    toggle_mute()
-                case EventState.MoveUp:
-                    move_dir = move_dir[0] + 0, move_dir[1] - 1
-                case EventState.MoveDown:
-                    move_dir = move_dir[0] + 0, move_dir[1] + 1
-                case EventState.MoveLeft:
-                    move_dir = move_dir[0] - 1, move_dir[1] + 0
-                case EventState.MoveRight:
-                    move_dir = move_dir[0] + 1, move_dir[1] + 0
+        events += game.parse_events(running)
+        running, move_dir = game.handle_events(events, move_dir)
 
         # Move player
         player.position = (player.position[0] + move_dir[0], player.position[1] + move_dir[1])
+        profiler.lap("events")
+
+        # Update physics, in fixed steps covering the time the last frame took. The state of every body is read
+        # once, for the game and for drawing, also without steps, as bodies may have come and gone.
+        steps = loop.advance(frame_time)
+        entities = bodies.entities
+        entities.sync(space)
+        if steps:
+            game.settle_bricks(steps)
+        profiler.lap("physics")
+
+        if recorder:
+            recorder.frame(steps, [event.value for event in events], removed)
+            if recorder.keyframe_due(loop.total_steps):
+                recorder.keyframe(loop.total_steps, capture_state(space))
+            profiler.lap("record")
+        game.audio.dispatch()
+        profiler.lap("sound")
 
         # Clear screen
         screen.fill(pygame.Color("darkgrey"))
 
-        # Draw objects
-        space.debug_draw(draw_options)
-        draw_window(screen)
+        # Draw what is in view, following the player
+        camera.size = screen.get_size()
+        camera.follow(player.position, frame_time)
+        renderer.draw(screen, entities.space_ids, loop.blend(entities.space_ids, entities.space_state), camera=camera)
+        game.draw_window(screen)
 
         if DEBUG_CAPTURE_STATE:
-            state = []
-            for x in space.shapes:
-                s = "%s %s %s" % (x, x.body.position, x.body.velocity)
-                state.append(s)
-
-        # Update physics
-        fps = TARGET_FPS
-        dt = 1.0 / fps
-        space.step(dt)
+            game.state = np.column_stack((entities.positions, entities.velocities))[entities.alive()]
 
         move_dir = move_dir[0] * MOVE_DAMPEN_FACTOR, move_dir[1] * MOVE_DAMPEN_FACTOR
 
         # Update objects
         if RANDOMIZE_BALL_SIZE:
-            def randomize_circle_radius(shape):
-                new_radius = shape.radius + random.uniform(-0.4, 0.4)
-                replace_shape(shape, create_ball_shape(shape.body, new_radius))
-            circles = [shape for shape in space.shapes if isinstance(shape, pymunk.shapes.Circle)]
-            list(map(randomize_circle_radius, circles))
+            game.randomize_ball_sizes()
+        profiler.lap("draw")
 
         # Info and flip screen
-        draw_hud(clock, font, screen)
+        game.draw_hud(clock, font, screen)
+        profiler.lap("hud")
 
         pygame.display.flip()
-        clock.tick(fps)
+        profiler.lap("flip")
+        frame_time = clock.tick(TARGET_FPS) / 1000
+        profiler.lap("wait")
+        profiler.end_frame()
+
+    if PROFILE_TRACE:
+        profiler.dump(PROFILE_TRACE)
+    if recorder:
+        recorder.close()
+
+
+def replay(path):
+    """
+    Runs a session recorded by main(record=path) again, headless and as fast as it goes.
+
+    The game does the same thing in the same order as the recorded frames,
+    without drawing, and compares the bodies with each keyframe on the way.
+
+    :return: Dict of timings, and the largest difference found from a keyframe.
+    """
+    header, records = read_session(path)
+    random.seed(header["seed"])
+    space = create_space()
+    game = BrickKnocker(space, header.get("sleep_mode", False))
+    game.load_sfx(load=False)
+    game.setup_level()
+    player, bodies = game.player, game.bodies
+    loop = FixedTimestep(space, header["step_rate"], header["sub_steps"], interpolate=False)
+    move_dir = (0, 0)
+
+    frames = keyframes = 0
+    keyframe_error = 0.0
+    step_time = 0.0
+    start_time = time.perf_counter()
+    for record in records:
+        if isinstance(record, Keyframe):
+            current = capture_state(space)
+            if current.shape != record.state.shape:
+                keyframe_error = float("inf")
+            elif len(current):
+                keyframe_error = max(keyframe_error, float(np.abs(current - record.state).max()))
+            keyframes += 1
+            continue
+
+        bodies.flush(space, limit=record.removed)
+        _, move_dir = game.handle_events([EventState(code) for code in record.events], move_dir)
+        player.position = (player.position[0] + move_dir[0], player.position[1] + move_dir[1])
+        if record.steps:
+            step_start = time.perf_counter()
+            loop.step(record.steps)
+            step_time += time.perf_counter() - step_start
+            bodies.entities.sync(space)
+            game.settle_bricks(record.steps)
+        move_dir = move_dir[0] * MOVE_DAMPEN_FACTOR, move_dir[1] * MOVE_DAMPEN_FACTOR
+        if RANDOMIZE_BALL_SIZE:
+            game.randomize_ball_sizes()
+        frames += 1
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        "frames": frames,
+        "steps": loop.total_steps,
+        "seconds": elapsed,
+        "step_seconds": step_time,
+        "speedup": loop.time / elapsed if elapsed else 0.0,
+        "keyframes": keyframes,
+        "keyframe_error": keyframe_error,
+    }
 
 
 def replace_shape(shape, with_shape):
@@ -491,4 +938,11 @@ def replace_shape(shape, with_shape):
 
 
 if __name__ == "__main__":
-    sys.exit(main())
+    parser = argparse.ArgumentParser(description="Knock over bricks with a lot of balls.")
+    parser.add_argument("--record", help="Records the session to this file.")
+    parser.add_argument("--replay", help="Replays a recorded session headless and prints its timings.")
+    args = parser.parse_args()
+    if args.replay:
+        print(json.dumps(replay(args.replay), indent=2))
+        sys.exit()
+    sys.exit(main(args.record))
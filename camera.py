@@ -0,0 +1,99 @@
+"""
+A view onto a part of a pymunk space, panned and zoomed, following a target.
+
+The camera is centered on a world position and draws the world at a zoom,
+stepped so that renderers can cache sprites per zoom level. follow() pans
+smoothly to keep a target, such as the player, within the middle of the
+view. visible() asks the space's spatial index which shapes overlap the
+viewport, so a renderer only draws the bodies that can be seen, however
+large the world. contains() tests positions against the viewport instead,
+which is cheaper when much of the world is in view.
+
+    camera = Camera(screen.get_size(), (WIDTH / 2, HEIGHT / 2))
+    while running:
+        camera.follow(player.position, frame_time)
+        renderer.draw(screen, *loop.state(), camera=camera)
+"""
+import numpy as np
+import pymunk
+import pymunk.pygame_util
+
+ZOOM_STEP = 2 ** 0.25  # Zoom factor per level
+ZOOM_LEVELS = -8, 8  # Lowest and highest zoom level, a quarter to four times
+FOLLOW_MARGIN = 0.05  # Part of the view on each side the target is kept out of
+FOLLOW_RATE = 5.0  # Share of the distance to the target position covered per second
+VIEW_PADDING = 50  # World units around the view also counted as visible, covering the extent of shapes
+
+
+class Camera:
+    def __init__(self, size, position=(0, 0), level=0):
+        """
+        :param size: Size of the view on the screen, in pixels.
+        :param position: World position at the center of the view.
+        :param level: Zoom level, the zoom is ZOOM_STEP ** level.
+        """
+        self.size = size
+        self.position = np.array(position, dtype=float)
+        self.home = self.position.copy(), level
+        self.level = level
+        self.offset = np.zeros(2)  # Panned away from the followed target
+
+    @property
+    def zoom(self):
+        return ZOOM_STEP ** self.level
+
+    def zoom_by(self, levels):
+        """Zooms in by levels, or out for negative ones, keeping the center where it is."""
+        self.level = min(max(self.level + levels, ZOOM_LEVELS[0]), ZOOM_LEVELS[1])
+
+    def pan(self, dx, dy):
+        """Moves the view by dx, dy screen pixels, it keeps following the target from there."""
+        offset = np.array((dx, dy), dtype=float) / self.zoom
+        if pymunk.pygame_util.positive_y_is_up:
+            offset[1] = -offset[1]
+        self.position += offset
+        self.offset += offset
+
+    def reset(self):
+        """Back to where the camera started, without any panning or zoom."""
+        position, self.level = self.home
+        self.position = position.copy()
+        self.offset[:] = 0
+
+    def follow(self, target, elapsed):
+        """
+        Pans towards keeping target out of the margins of the view.
+
+        :param elapsed: Seconds since the last call.
+        """
+        half = np.asarray(self.size, dtype=float) / (2 * self.zoom)
+        inner = half * (1 - 2 * FOLLOW_MARGIN)
+        target = np.asarray(target, dtype=float) + self.offset
+        goal = np.clip(self.position, target - inner, target + inner)
+        self.position += (goal - self.position) * min(FOLLOW_RATE * elapsed, 1.0)
+
+    def viewport(self, padding=VIEW_PADDING):
+        """:return: pymunk.BB of the world in view."""
+        half = np.asarray(self.size, dtype=float) / (2 * self.zoom) + padding
+        (left, bottom), (right, top) = (self.position - half).tolist(), (self.position + half).tolist()
+        return pymunk.BB(left, bottom, right, top)
+
+    def visible(self, space):
+        """:return: Array of the ids of the bodies with a shape in view, from a query of the spatial index."""
+        shapes = space.bb_query(self.viewport(), pymunk.ShapeFilter())
+        return np.unique(np.fromiter((shape.body.id for shape in shapes), dtype=np.uintp, count=len(shapes)))
+
+    def contains(self, points, padding=VIEW_PADDING):
+        """:return: Bool array of which of the (points, 2) world positions are in view."""
+        half = np.asarray(self.size, dtype=float) / (2 * self.zoom) + padding
+        return (np.abs(np.asarray(points, dtype=float) - self.position) <= half).all(axis=1)
+
+    def to_screen(self, points):
+        """
+        :param points: World position, or (points, 2) array of them.
+        :return: Matching screen positions, as floats.
+        """
+        screen = (np.asarray(points, dtype=float) - self.position) * self.zoom
+        if pymunk.pygame_util.positive_y_is_up:
+            screen[..., 1] = -screen[..., 1]
+        return screen + np.asarray(self.size, dtype=float) / 2
@@ -0,0 +1,117 @@
+"""
+Collision callbacks that only record what happened, handled in one pass after the step.
+
+Inside space.step, a callback registered with on() appends the two shapes,
+and optionally the kinetic energy of one of their bodies, to its handler's
+buffers. The first record of a step schedules a single post-step callback,
+which passes each handler's records to its process function in one call,
+after the step. Removals, sounds, counters and shape changes then happen
+outside the step, batched per handler.
+
+    events = CollisionEvents(space)
+
+    def remove_bricks(space, bricks, balls, energies):
+        space.remove(*bricks, *(brick.body for brick in bricks))
+
+    events.on(BRICK, BALL, remove_bricks, "separate")
+
+Callbacks that must change the contact itself, such as a pre_solve that
+sets the normal, still have to be set on the handler directly.
+"""
+import numpy as np
+
+EVENT_CAPACITY = 256  # Records per handler and step before its buffers grow
+PHASES = ("begin", "pre_solve", "post_solve", "separate")
+
+
+class EventBuffer:
+    """Records of one handler, preallocated and reused every step."""
+
+    def __init__(self, name, process, capacity=EVENT_CAPACITY):
+        self.name = name
+        self.process = process
+        self.shapes_a = [None] * capacity
+        self.shapes_b = [None] * capacity
+        self.energies = np.zeros(capacity)
+        self.count = 0
+
+    def append(self, shape_a, shape_b, energy):
+        if self.count == len(self.shapes_a):
+            self.shapes_a.extend([None] * self.count)
+            self.shapes_b.extend([None] * self.count)
+            self.energies = np.concatenate((self.energies, np.zeros(self.count)))
+        self.shapes_a[self.count] = shape_a
+        self.shapes_b[self.count] = shape_b
+        self.energies[self.count] = energy
+        self.count += 1
+
+    def flush(self, space):
+        count = self.count
+        shapes_a, shapes_b = self.shapes_a[:count], self.shapes_b[:count]
+        energies = self.energies[:count].copy()
+        # Let go of the shapes, e.g. the ones about to be removed. Removals can record new collisions,
+        # such as a separate, so the buffers are free again before process runs.
+        self.shapes_a[:count] = self.shapes_b[:count] = [None] * count
+        self.count = 0
+        self.process(space, shapes_a, shapes_b, energies)
+
+
+class CollisionEvents:
+    def __init__(self, space, counter=None):
+        """
+        :param counter: Called with (handler name, records) for each handler after every step it had records,
+            e.g. FrameProfiler.count.
+        """
+        self.space = space
+        self.counter = counter
+        self.buffers = {}
+        self.scheduled = False
+
+    def on(self, collision_type_a, collision_type_b, process, phase="begin", energy_shape=None, accept=True,
+           name=None):
+        """
+        Records the collisions of a pair of collision types, for process to handle after the step.
+
+        Registering the same pair and phase again replaces the earlier process.
+
+        :param process: Called after the step as process(space, shapes_a, shapes_b, energies), with lists of the
+            shapes of each collision, ordered as the collision types, and an array of energies.
+        :param phase: 'begin', 'pre_solve', 'post_solve' or 'separate'.
+        :param energy_shape: 0 or 1, records the kinetic energy of that shape's body, otherwise energies are zero.
+        :param accept: What begin and pre_solve return, False ignores the collision.
+        :param name: Name passed to the counter, defaults to the process function's name.
+        """
+        if phase not in PHASES:
+            raise ValueError(f"Unknown collision phase {phase}, expected one of {PHASES}")
+        buffer = EventBuffer(name or process.__name__, process)
+        self.buffers[collision_type_a, collision_type_b, phase] = buffer
+
+        def record(arbiter, space, data):
+            shapes = arbiter.shapes
+            energy = 0.0 if energy_shape is None else shapes[energy_shape].body.kinetic_energy
+            buffer.append(shapes[0], shapes[1], energy)
+            if not self.scheduled:
+                self.scheduled = space.add_post_step_callback(self.dispatch, self)
+            return accept
+
+        record.__name__ = buffer.name
+        handler = self.space.add_collision_handler(collision_type_a, collision_type_b)
+        setattr(handler, phase, record)
+
+    def dispatch(self, space, key=None):
+        """
+        Handles every record of the step, run as a post-step callback.
+
+        Processing can record more collisions, e.g. separate callbacks fired by a removal. This callback is still
+        scheduled then, so no other can be, and those records are handled here too, until every buffer is empty.
+        """
+        pending = True
+        while pending:
+            pending = False
+            for buffer in self.buffers.values():
+                if buffer.count:
+                    pending = True
+                    if self.counter is not None:
+                        self.counter(buffer.name, buffer.count)
+                    buffer.flush(space)
+        self.scheduled = False
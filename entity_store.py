@@ -0,0 +1,201 @@
+"""
+Array-backed store of the entities in a pymunk space.
+
+Each entity is a slot in a set of contiguous arrays: kind, color, mass,
+position, angle and velocity. sync() refreshes the arrays from the space with
+a single batched query, after which rendering, culling, HUD stats and sound
+triggers can read them without touching the bodies. The query also covers
+the bodies that are not entities, such as the static one, so space_ids and
+space_state hold every body for drawing.
+
+    entities = EntityStore()
+    entity = entities.add(body, "ball", color)
+    ...
+    loop.advance(frame_time)
+    entities.sync(space)
+    speeds = np.linalg.norm(entities.velocities[entities.of_kind("ball")], axis=1)
+    renderer.draw(screen, entities.space_ids, loop.blend(entities.space_ids, entities.space_state))
+"""
+import numpy as np
+import pymunk.batch
+
+INITIAL_CAPACITY = 1024
+FREE = -1
+
+SYNC_FIELDS = (pymunk.batch.BodyFields.BODY_ID | pymunk.batch.BodyFields.POSITION
+               | pymunk.batch.BodyFields.ANGLE | pymunk.batch.BodyFields.VELOCITY)
+
+
+def find_ids(keys, ids, order=None):
+    """
+    Looks up body ids in an unsorted array of unique ones, in time growing with len(ids).
+
+    :param order: np.argsort(keys), when it is kept from an earlier lookup.
+    :return: (index, found) arrays, the index into keys of each of ids, valid where found is True.
+    """
+    if order is None:
+        order = np.argsort(keys)
+    if len(order) == 0:
+        return np.zeros(len(ids), dtype=np.intp), np.zeros(len(ids), dtype=bool)
+    index = order[np.searchsorted(keys, ids, sorter=order).clip(0, len(order) - 1)]
+    return index, keys[index] == ids
+
+
+class EntityStore:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.kind_names = []
+        self.kind_codes = {}
+        self.bodies = []
+        self.slot_of = {}
+        self.free = []
+        self.buffer = pymunk.batch.Buffer()
+
+        # Rows of the last batched query matched to entities, kept while the bodies stay the same.
+        self.match_ids = None
+        self.match_rows = None
+        self.match_entities = None
+
+        # Every body in the space as of the last sync(), in space iteration order, with x, y and angle.
+        self.space_ids = np.zeros(0, dtype=np.uintp)
+        self.space_state = np.zeros((0, 3))
+
+        self.body_ids = np.zeros(0, dtype=np.uintp)
+        self.kinds = np.zeros(0, dtype=np.int16)
+        self.colors = np.zeros((0, 4), dtype=np.uint8)
+        self.masses = np.zeros(0)
+        self.positions = np.zeros((0, 2))
+        self.angles = np.zeros(0)
+        self.velocities = np.zeros((0, 2))
+        self._grow(capacity)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def add(self, body, kind, color=(255, 255, 255, 255)):
+        """
+        :return: The entity id, an index into the arrays.
+        """
+        if not self.free:
+            self._grow(2 * len(self.bodies))
+        entity = self.free.pop()
+
+        self.bodies[entity] = body
+        self.slot_of[body.id] = entity
+        self.body_ids[entity] = body.id
+        self.kinds[entity] = self._kind_code(kind)
+        self.colors[entity] = tuple(color)
+        self.masses[entity] = body.mass
+        self.positions[entity] = body.position
+        self.angles[entity] = body.angle
+        self.velocities[entity] = body.velocity
+        self.match_ids = None
+        return entity
+
+    def add_many(self, bodies, kind, color=(255, 255, 255, 255), positions=None, velocities=None):
+        """
+        Adds bodies of one kind at once.
+
+        :param positions: (bodies, 2) array of their positions, read from the bodies if not given.
+        :param velocities: Same for their velocities.
+        :return: Array of their entity ids.
+        """
+        bodies = list(bodies)
+        count = len(bodies)
+        if len(self.free) < count:
+            self._grow(max(2 * len(self.bodies), len(self.bodies) + count - len(self.free)))
+        # Taken from the end of the free list, in the order add() would pop them.
+        entities = np.array(self.free[len(self.free) - count:][::-1], dtype=np.intp)
+        del self.free[len(self.free) - count:]
+
+        ids = np.fromiter((body.id for body in bodies), dtype=np.uintp, count=count)
+        for entity, body in zip(entities.tolist(), bodies):
+            self.bodies[entity] = body
+        self.slot_of.update(zip(ids.tolist(), entities.tolist()))
+        self.body_ids[entities] = ids
+        self.kinds[entities] = self._kind_code(kind)
+        self.colors[entities] = tuple(color)
+        self.masses[entities] = [body.mass for body in bodies]
+        self.positions[entities] = [tuple(body.position) for body in bodies] if positions is None else positions
+        self.angles[entities] = [body.angle for body in bodies]
+        self.velocities[entities] = [tuple(body.velocity) for body in bodies] if velocities is None else velocities
+        self.match_ids = None
+        return entities
+
+    def remove(self, entity):
+        del self.slot_of[self.body_ids[entity]]
+        self.bodies[entity] = None
+        self.kinds[entity] = FREE
+        self.free.append(entity)
+        self.match_ids = None
+
+    def entity_of(self, body):
+        return self.slot_of.get(body.id)
+
+    def of_kind(self, kind):
+        """Entity ids of every entity of a kind."""
+        code = self.kind_codes.get(kind)
+        if code is None:
+            return np.zeros(0, dtype=np.intp)
+        return np.flatnonzero(self.kinds == code)
+
+    def count(self, kind):
+        code = self.kind_codes.get(kind)
+        return 0 if code is None else int(np.count_nonzero(self.kinds == code))
+
+    def alive(self):
+        return self.kinds != FREE
+
+    def outside(self, limit):
+        """Entity ids positioned outside +/-limit on either axis, or at NaN."""
+        return np.flatnonzero(self.alive() & ~(np.abs(self.positions) <= limit).all(axis=1))
+
+    def sync(self, space):
+        """Copies every entity's position, angle and velocity from the space, and every body's into space_state."""
+        self.buffer.clear()
+        pymunk.batch.get_space_bodies(space, SYNC_FIELDS, self.buffer)
+        ids = np.frombuffer(self.buffer.int_buf(), dtype=np.uintp)
+        values = np.frombuffer(self.buffer.float_buf(), dtype=np.float64).reshape(-1, 5)
+        # Copied, the buffer is reused by the next sync.
+        self.space_ids = ids.copy()
+        self.space_state = values[:, 0:3].copy()
+        rows, entities = self.match(ids)
+        values = values[rows]
+        self.positions[entities] = values[:, 0:2]
+        self.angles[entities] = values[:, 2]
+        self.velocities[entities] = values[:, 3:5]
+
+    def match(self, ids):
+        """
+        Pairs the rows of a batched query with entities, rows of bodies that are not entities are left out.
+
+        :return: (rows, entities) index arrays.
+        """
+        if np.array_equal(ids, self.match_ids):
+            return self.match_rows, self.match_entities
+        entities = np.flatnonzero(self.alive())
+        index, found = find_ids(self.body_ids[entities], ids)
+        rows = np.flatnonzero(found)
+        entities = entities[index[rows]]
+        self.match_ids, self.match_rows, self.match_entities = ids.copy(), rows, entities
+        return rows, entities
+
+    def _kind_code(self, kind):
+        if kind not in self.kind_codes:
+            self.kind_codes[kind] = len(self.kind_names)
+            self.kind_names.append(kind)
+        return self.kind_codes[kind]
+
+    def _grow(self, capacity):
+        old = len(self.bodies)
+        if capacity <= old:
+            return
+        extra = capacity - old
+        self.bodies.extend([None] * extra)
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.body_ids = np.concatenate((self.body_ids, np.zeros(extra, dtype=np.uintp)))
+        self.kinds = np.concatenate((self.kinds, np.full(extra, FREE, dtype=np.int16)))
+        self.colors = np.concatenate((self.colors, np.zeros((extra, 4), dtype=np.uint8)))
+        self.masses = np.concatenate((self.masses, np.zeros(extra)))
+        self.positions = np.concatenate((self.positions, np.zeros((extra, 2))))
+        self.angles = np.concatenate((self.angles, np.zeros(extra)))
+        self.velocities = np.concatenate((self.velocities, np.zeros((extra, 2))))
@@ -0,0 +1,162 @@
+"""
+Opt-in timing of the phases of each frame, with a scrolling overlay and trace dumps.
+
+lap() charges the time since the previous lap to a named phase, so a frame
+is split into consecutive phases, e.g. events, physics, draw and flip.
+count() bumps per-frame counters, such as sound plays, and counted() wraps
+collision callbacks to count their calls. end_frame() adds the frame to the
+trace, which draw() shows as a stacked bar per frame against the frame
+budget, and dump() writes out as CSV or JSON. While disabled, every call
+returns straight away.
+
+    profiler = FrameProfiler(budget_ms=1000 / TARGET_FPS)
+    handler.begin = profiler.counted(brick_ball_collide)
+    while running:
+        parse_events()
+        profiler.lap("events")
+        ...
+        profiler.draw(screen, (10, 10), font)
+        pygame.display.flip()
+        profiler.lap("flip")
+        clock.tick(TARGET_FPS)
+        profiler.lap("wait")
+        profiler.end_frame()
+    profiler.dump("profile.csv")
+"""
+import csv
+import functools
+import itertools
+import json
+import time
+from collections import deque
+
+import pygame
+
+TRACE_FRAMES = 36000  # Frames kept for dump(), older ones are dropped
+OVERLAY_SIZE = 240, 80  # One column per frame, the full height is twice the budget
+LEGEND_PERIOD = 30  # Frames between legend updates
+PHASE_COLORS = [pygame.Color(name) for name in
+                ("dodgerblue", "orange", "limegreen", "orchid", "gold", "tomato", "cyan", "gray40")]
+BUDGET_COLOR = pygame.Color("white")
+OVERLAY_BACKGROUND = pygame.Color("black")
+
+
+class FrameProfiler:
+    def __init__(self, budget_ms, enabled=False, history=TRACE_FRAMES):
+        """
+        :param budget_ms: Time per frame at the target frame rate, drawn as a line on the overlay.
+        """
+        self.budget_ms = budget_ms
+        self.enabled = enabled
+        self.trace = deque(maxlen=history)
+        self.phases = {}  # Color of each phase, in the order they were first seen
+        self.counters = []
+        self.times = {}
+        self.counts = {}
+        self.frame = 0
+        self.last = time.perf_counter()
+        self.graph = None
+        self.legend = []
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.times.clear()
+        self.counts.clear()
+        self.last = time.perf_counter()
+
+    def lap(self, phase):
+        """Charges the time since the last lap to phase."""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if phase not in self.phases:
+            self.phases[phase] = PHASE_COLORS[len(self.phases) % len(PHASE_COLORS)]
+        self.times[phase] = self.times.get(phase, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+    def count(self, name, n=1):
+        if not self.enabled:
+            return
+        if name not in self.counts:
+            if name not in self.counters:
+                self.counters.append(name)
+            self.counts[name] = 0
+        self.counts[name] += n
+
+    def counted(self, callback, name=None):
+        """
+        Wraps callback, e.g. a collision handler callback, to count its calls.
+
+        :param name: Counter name, defaults to the callback's name.
+        """
+        name = name or callback.__name__
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            self.count(name)
+            return callback(*args, **kwargs)
+
+        return wrapper
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        row = {"frame": self.frame, **self.times, **self.counts}
+        self.trace.append(row)
+        self._plot(row)
+        self.frame += 1
+        self.times.clear()
+        self.counts.clear()
+
+    def draw(self, surface, position, font):
+        """Draws the frame history with a legend of mean phase times and counts to its right."""
+        if not self.enabled or self.graph is None:
+            return
+        surface.blit(self.graph, position)
+        if self.frame % LEGEND_PERIOD == 0 or not self.legend:
+            self.legend = self._legend(font)
+        x, y = position[0] + self.graph.get_width() + 5, position[1]
+        for line in self.legend:
+            surface.blit(line, (x, y))
+            y += line.get_height()
+
+    def dump(self, path):
+        """Writes the trace, one row per frame, as JSON if path ends in .json and as CSV otherwise."""
+        rows = list(self.trace)
+        with open(path, "w", newline="") as f:
+            if path.endswith(".json"):
+                json.dump({"budget_ms": self.budget_ms, "frames": rows}, f)
+            else:
+                writer = csv.DictWriter(f, ["frame", *self.phases, *self.counters], restval=0)
+                writer.writeheader()
+                writer.writerows(rows)
+
+    def _plot(self, row):
+        # Scrolls the graph one column left and draws the new frame's stacked bar at the right.
+        if self.graph is None:
+            self.graph = pygame.Surface(OVERLAY_SIZE)
+            self.graph.fill(OVERLAY_BACKGROUND)
+        width, height = OVERLAY_SIZE
+        scale = height / (2 * self.budget_ms)
+        self.graph.scroll(-1, 0)
+        self.graph.fill(OVERLAY_BACKGROUND, (width - 1, 0, 1, height))
+        bottom = height
+        for phase, color in self.phases.items():
+            top = bottom - row.get(phase, 0.0) * scale
+            if top < bottom - 0.5:
+                pygame.draw.line(self.graph, color, (width - 1, bottom - 1), (width - 1, max(top, 0)))
+            bottom = top
+            if bottom <= 0:
+                break
+        self.graph.set_at((width - 1, height - round(self.budget_ms * scale)), BUDGET_COLOR)
+
+    def _legend(self, font):
+        rows = list(itertools.islice(reversed(self.trace), OVERLAY_SIZE[0]))
+        lines = []
+        for phase, color in self.phases.items():
+            mean = sum(row.get(phase, 0.0) for row in rows) / len(rows)
+            lines.append(font.render(f"{phase} {mean:.2f} ms", True, color, OVERLAY_BACKGROUND))
+        for name in self.counters:
+            mean = sum(row.get(name, 0) for row in rows) / len(rows)
+            lines.append(font.render(f"{name} {mean:.1f}/frame", True, BUDGET_COLOR, OVERLAY_BACKGROUND))
+        return lines
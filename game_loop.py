@@ -0,0 +1,128 @@
+"""
+Fixed timestep physics loop shared by brick_knocker, breakout and ball_pit.
+
+Rendered frames feed their elapsed time into an accumulator, and the space
+is stepped in fixed increments until the accumulator is drained, so the
+simulation runs at the same speed whatever the frame rate. A cap on the
+steps per frame stops a slow frame from snowballing into ever more catch-up
+steps. state() gives the bodies blended between the last two physics
+states, which keeps motion smooth when frames and steps do not line up, and
+blend() does the same for a state already read, e.g. by EntityStore.sync.
+
+    loop = FixedTimestep(space, step_rate=120)
+    renderer = SpriteRenderer(space)
+    while running:
+        loop.advance(clock.tick(TARGET_FPS) / 1000)
+        renderer.draw(screen, *loop.state())
+"""
+import numpy as np
+import pymunk.batch
+
+from entity_store import find_ids
+
+STEP_RATE = 120  # Physics steps per simulated second
+SUB_STEPS = 1  # Space steps per physics step
+MAX_STEPS_PER_FRAME = 8  # Beyond this, time is dropped and the simulation slows down instead
+
+STATE_FIELDS = pymunk.batch.BodyFields.POSITION | pymunk.batch.BodyFields.ANGLE
+
+
+class FixedTimestep:
+    def __init__(self, space, step_rate=STEP_RATE, sub_steps=SUB_STEPS, max_steps=MAX_STEPS_PER_FRAME,
+                 interpolate=True):
+        self.space = space
+        self.dt = 1.0 / step_rate
+        self.sub_steps = sub_steps
+        self.max_steps = max_steps
+        self.interpolate = interpolate
+
+        self.accumulator = 0.0
+        self.alpha = 0.0
+        self.steps = 0  # Physics steps run by the last advance()
+        self.total_steps = 0
+        self.dropped_time = 0.0
+
+        # Body states before the last step, and scratch for the current ones.
+        self.previous = pymunk.batch.Buffer()
+        self.current = pymunk.batch.Buffer()
+        self.has_previous = False
+
+    @property
+    def time(self):
+        """Simulated seconds so far."""
+        return self.total_steps * self.dt
+
+    def advance(self, elapsed):
+        """
+        Steps the space for elapsed seconds of real time.
+
+        :return: Number of physics steps run.
+        """
+        self.accumulator += elapsed
+        steps = min(int(self.accumulator / self.dt), self.max_steps)
+        self.accumulator -= steps * self.dt
+        if self.accumulator >= self.dt:
+            # Over the cap, let the simulation fall behind rather than catch up later.
+            dropped = self.accumulator - self.accumulator % self.dt
+            self.dropped_time += dropped
+            self.accumulator -= dropped
+
+        self.step(steps)
+        self.alpha = self.accumulator / self.dt
+        return steps
+
+    def step(self, steps=1):
+        """Runs exactly steps physics steps, whatever the time, e.g. to replay a recording."""
+        sub_dt = self.dt / self.sub_steps
+        for step in range(steps):
+            if self.interpolate and step == steps - 1:
+                self._read(self.previous)
+                self.has_previous = True
+            for _ in range(self.sub_steps):
+                self.space.step(sub_dt)
+
+        self.steps = steps
+        self.total_steps += steps
+        return steps
+
+    def state(self):
+        """
+        Interpolated state of every body in the space, in space iteration order.
+
+        :return: (ids, state) arrays, state shaped (bodies, 3) as x, y, angle.
+        """
+        ids, current = self._read(self.current)
+        return ids, self.blend(ids, current)
+
+    def blend(self, ids, current):
+        """
+        Interpolates a state read after the last advance(), e.g. by EntityStore.sync, instead of reading it again.
+
+        :param ids: Body ids of the state.
+        :param current: Matching (bodies, 3) array of x, y and angle.
+        :return: The interpolated state, or current itself when there is nothing to blend.
+        """
+        if not (self.interpolate and self.has_previous) or self.alpha == 0:
+            return current
+        previous_ids, previous = self._arrays(self.previous)
+        if np.array_equal(ids, previous_ids):
+            return previous + self.alpha * (current - previous)
+        if len(previous_ids) == 0:
+            return current
+
+        # Bodies were added or removed since the last step, only blend those in both.
+        index, match = find_ids(previous_ids, ids)
+        blended = current.copy()
+        blended[match] += (1 - self.alpha) * (previous[index[match]] - current[match])
+        return blended
+
+    def _read(self, buffer):
+        buffer.clear()
+        pymunk.batch.get_space_bodies(self.space, pymunk.batch.BodyFields.BODY_ID | STATE_FIELDS, buffer)
+        return self._arrays(buffer)
+
+    @staticmethod
+    def _arrays(buffer):
+        ids = np.frombuffer(buffer.int_buf(), dtype=np.uintp)
+        state = np.frombuffer(buffer.float_buf(), dtype=np.float64).reshape(-1, 3)
+        return ids, state
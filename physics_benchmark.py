@@ -0,0 +1,231 @@
+"""
+Steps per second and per-step times of the game scenes, without a display.
+
+Each scene is built the way its game builds it, seeded, run for some untimed
+warmup steps and then stepped on its own, so only space.step is timed:
+
+    brick_knocker  the level, with --balls fired from the player over the warmup
+    breakout       the brick wall and paddle
+    ball_pit       the pit, with --pit-balls balls and the special ball
+
+Collision callbacks are counted by the games' own profiler counters, which
+CollisionEvents and FrameProfiler.counted feed. Each scene runs in a process
+of its own, see peak_rss_mb(). Each scene is run --repeat times, and
+the checksum of its final body positions has to come out the same every
+time, otherwise the scene is reported as nondeterministic and the benchmark
+exits with an error. Timings are those of the first run. Results are
+printed as a table, and --output writes them as JSON, along with the
+settings, to compare runs:
+
+    python physics_benchmark.py --output before.json
+    python physics_benchmark.py --scenes ball_pit --pit-balls 5000 --iterations 5
+    python physics_benchmark.py --threads 2 --output threaded.json
+"""
+import os
+
+# The games create their windows and load sounds at import, give them dummy drivers.
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import argparse
+import hashlib
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pymunk
+import pymunk.batch
+
+from frame_profiler import FrameProfiler
+
+SCENES = ('brick_knocker', 'breakout', 'ball_pit')
+BALLS = 500
+PIT_BALLS = 1000
+STEPS = 1000
+WARMUP = 500
+SEED = 0
+REPEAT = 2  # Runs per scene, compared for determinism
+PERCENTILES = (50, 90, 99)
+
+
+def brick_knocker_scene(balls, threaded):
+    """:return: (space, dt, spray, profiler), spray(n) fires n more balls, profiler counts the callbacks."""
+    import brick_knocker
+
+    space = brick_knocker.create_space(threaded)
+    game = brick_knocker.BrickKnocker(space)
+    game.load_sfx(load=False)
+    game.setup_level()
+
+    def spray(count):
+        if count:
+            game.fire_balls([game.player.position] * count)
+
+    return space, 1 / brick_knocker.PHYSICS_RATE, spray, game.profiler
+
+
+def breakout_scene(balls, threaded):
+    import breakout
+
+    space, _ = breakout.create_space(threaded)
+    return space, 1 / breakout.fps, None, breakout.profiler
+
+
+def ball_pit_scene(balls, threaded):
+    import ball_pit
+
+    ball_pit.space = pymunk.Space(threaded=threaded)
+    ball_pit.setup(balls)
+    # The pit has no profiler of its own.
+    profiler = FrameProfiler(1000 / ball_pit.FPS)
+    ball_pit.collisions.counter = profiler.count
+    return ball_pit.space, 1 / ball_pit.FPS, None, profiler
+
+
+SCENE_SETUP = {
+    'brick_knocker': brick_knocker_scene,
+    'breakout': breakout_scene,
+    'ball_pit': ball_pit_scene,
+}
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process so far in MB, the scene's own as each scene gets a fresh process."""
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def checksum(space):
+    """Hash of every body position, equal between runs when the simulation is deterministic."""
+    buffer = pymunk.batch.Buffer()
+    pymunk.batch.get_space_bodies(space, pymunk.batch.BodyFields.POSITION, buffer)
+    return hashlib.sha1(bytes(buffer.float_buf())).hexdigest()[:16]
+
+
+def run(scene, balls, steps, warmup, seed, iterations=None, damping=None, threads=None):
+    """
+    Builds and steps one scene.
+
+    :param balls: Balls sprayed into brick_knocker or dropped into ball_pit.
+    :param iterations: Overrides space.iterations.
+    :param damping: Overrides space.damping.
+    :param threads: Steps with pymunk's threaded solver on this many threads.
+    :return: Dict of results.
+    """
+    random.seed(seed)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    space, dt, spray, profiler = SCENE_SETUP[scene](balls, threads is not None)
+    setup = time.perf_counter() - start_time
+    traced = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    if iterations is not None:
+        space.iterations = iterations
+    if damping is not None:
+        space.damping = damping
+    if threads is not None:
+        space.threads = threads
+    # Frames are never ended, so the profiler's counts add up over the whole run.
+    profiler.enabled = True
+    counts = profiler.counts
+
+    # Sprayed balls go in evenly over the warmup, or all at once without one.
+    sprayed = np.diff(np.linspace(0, balls, warmup + 1).round().astype(int)) if spray and warmup else []
+    if spray and not warmup:
+        spray(balls)
+    for step in range(warmup):
+        if spray:
+            spray(int(sprayed[step]))
+        space.step(dt)
+    warmup_counts = dict(counts)
+
+    durations = np.empty(steps)
+    for step in range(steps):
+        start_time = time.perf_counter()
+        space.step(dt)
+        durations[step] = time.perf_counter() - start_time
+
+    milliseconds = durations * 1000
+    return {
+        'scene': scene,
+        'bodies': len(space.bodies),
+        'shapes': len(space.shapes),
+        'setup_seconds': setup,
+        'steps_per_second': steps / durations.sum() if steps else 0.0,
+        'step_ms': {
+            'mean': float(milliseconds.mean()) if steps else 0.0,
+            **{f'p{p}': float(np.percentile(milliseconds, p)) if steps else 0.0 for p in PERCENTILES},
+            'max': float(milliseconds.max()) if steps else 0.0,
+        },
+        'callbacks': {name: count - warmup_counts.get(name, 0) for name, count in counts.items()},
+        'setup_python_mb': traced / 2 ** 20,
+        'peak_rss_mb': peak_rss_mb(),
+        'checksum': checksum(space),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenes', nargs='+', choices=SCENES, default=list(SCENES))
+    parser.add_argument('--balls', type=int, default=BALLS, help='Balls sprayed into brick_knocker.')
+    parser.add_argument('--pit-balls', type=int, default=PIT_BALLS, help='Balls dropped into ball_pit.')
+    parser.add_argument('--steps', type=int, default=STEPS)
+    parser.add_argument('--warmup', type=int, default=WARMUP, help='Untimed steps before the timed ones.')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help='Runs per scene, whose checksums must agree. 1 skips the check.')
+    parser.add_argument('--iterations', type=int, help='Overrides space.iterations.')
+    parser.add_argument('--damping', type=float, help='Overrides space.damping.')
+    parser.add_argument('--threads', type=int, help="Uses pymunk's threaded solver with this many threads.")
+    parser.add_argument('--output', help='JSON file for the results.')
+    args = parser.parse_args()
+
+    settings = {name: getattr(args, name) for name in
+                ('balls', 'pit_balls', 'steps', 'warmup', 'seed', 'repeat', 'iterations', 'damping', 'threads')}
+    results = []
+    nondeterministic = []
+    print(f'{"scene":>14} {"bodies":>7} {"steps/s":>9} {"mean ms":>8} {"p99 ms":>8} {"callbacks":>10} '
+          f'{"peak RSS MB":>12} {"checksum":>17}')
+    for scene in args.scenes:
+        balls = args.pit_balls if scene == 'ball_pit' else args.balls
+        runs = []
+        for _ in range(max(args.repeat, 1)):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                runs.append(pool.submit(run, scene, balls, args.steps, args.warmup, args.seed,
+                                        args.iterations, args.damping, args.threads).result())
+        result = runs[0]
+        result['checksums'] = [r['checksum'] for r in runs]
+        result['deterministic'] = len(set(result['checksums'])) == 1
+        results.append(result)
+        print(f'{scene:>14} {result["bodies"]:7d} {result["steps_per_second"]:9.0f} '
+              f'{result["step_ms"]["mean"]:8.3f} {result["step_ms"]["p99"]:8.3f} '
+              f'{sum(result["callbacks"].values()):10d} {result["peak_rss_mb"]:12.0f} '
+              f'{result["checksum"] if result["deterministic"] else "differs":>17}')
+        if not result['deterministic']:
+            nondeterministic.append(scene)
+            print(f'{scene}: repeated runs ended differently, checksums {", ".join(result["checksums"])}',
+                  file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'settings': settings,
+                'versions': {'python': platform.python_version(), 'pymunk': pymunk.version,
+                             'chipmunk': pymunk.chipmunk_version},
+                'results': results,
+            }, f, indent=2)
+
+    if nondeterministic:
+        sys.exit(f'Nondeterministic scenes: {", ".join(nondeterministic)}')
+
+
+if __name__ == '__main__':
+    main()
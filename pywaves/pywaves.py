@@ -1,5 +1,5 @@
 #!python
-# Dependencies: pygame
+# Dependencies: pygame, numpy (optional, for the 'numpy' backend)
 """
 /***************************************************************************
 	Author			:Charles Brissac
@@ -11,10 +11,12 @@
  ***************************************************************************/
 """
 
+import sys
 import pygame
 import math
 from pygame.locals import *
 from solver import *
+import solver
 
 DEBUG = True
 WIN_X = 330
@@ -22,10 +24,26 @@ WIN_Y = 330
 
 sf = 1000.
 
+
+def load_backend(name):
+    if name == 'list':
+        return solver
+    if name == 'numpy':
+        import solver_numpy
+        return solver_numpy
+    raise ValueError("Unknown solver backend: %s" % name)
+
+
 # http://graphics.cs.cmu.edu/nsp/course/15-464/Fall09/papers/StamFluidforGames.pdf
 class PyWaves:
 
-    def __init__(self):
+    def __init__(self, backend='list', linear_solver=None, tolerance=None):
+        self.solver = load_backend(backend)
+        if self.solver is solver:
+            if linear_solver not in (None, 'gauss_seidel'):
+                raise ValueError("The list backend only supports its fixed Gauss-Seidel solve, not %s" % linear_solver)
+        elif linear_solver is not None:
+            self.solver.set_linear_solver(linear_solver, tolerance)
         self.t_el = 0.0
         self.size = (N + 2) * (N + 2)
         pygame.display.init()
@@ -68,13 +86,16 @@ class PyWaves:
 
     def run(self):
 
-        self.allocate_data()
-        self.clear_data()
+        if self.solver is solver:
+            self.allocate_data()
+            self.clear_data()
+        else:
+            self.u, self.v, self.u_prev, self.v_prev = (self.solver.allocate() for _ in range(4))
 
         while self.RUNNING:
             # raw_input()
             self.RUNNING = self.handle_events()
-            self.u, self.v, self.u_prev, self.v_prev = velocity_step(self.u, self.v, self.u_prev, self.v_prev)
+            self.u, self.v, self.u_prev, self.v_prev = self.solver.velocity_step(self.u, self.v, self.u_prev, self.v_prev)
             self.t_el += dt
             self.update()
 
@@ -86,19 +107,25 @@ class PyWaves:
         self.render_grid(WIN_X, WIN_Y)
 
         pygame.display.flip()
-        print("\r%03.1f" % self.t_el)
+        stats = getattr(self.solver, 'step_stats', [])
+        print("\r%03.1f" % self.t_el + "".join(
+            " %s(b=%d): %d it, res %.2e" % (s.solver, s.b, s.iterations, s.residual) for s in stats))
 
     def render_grid(self, WIN_X, WIN_Y):
         dx = WIN_X / (N + 2)
         dy = WIN_Y / (N + 2)
         vcolor = (0, 0, 255)
+        value = self.solver.field_value
         for i in range(1, N):
             for j in range(1, N):
                 xc = (i + 0.5) * dx
                 yc = (j + 0.5) * dy
                 pygame.draw.line(self.screen, vcolor, (xc, yc),
-                                 (xc + sf * self.u[IX(i, j)], yc + sf * self.v[IX(i, j)]))
+                                 (xc + sf * value(self.u, i, j), yc + sf * value(self.v, i, j)))
 
 
 if __name__ == '__main__':
-    x = PyWaves()
+    # Usage: pywaves.py [list|numpy] [gauss_seidel|red_black|multigrid|cg] [tolerance]
+    x = PyWaves(backend=sys.argv[1] if len(sys.argv) > 1 else 'list',
+                linear_solver=sys.argv[2] if len(sys.argv) > 2 else None,
+                tolerance=float(sys.argv[3]) if len(sys.argv) > 3 else None)
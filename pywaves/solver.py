@@ -31,6 +31,10 @@ def IX(i, j):
     return (i) + (N + 2) * (j)
 
 
+def field_value(x, i, j):
+    return x[IX(i, j)]
+
+
 def SWAP(x0, x):
     tmp = x0
     x0 = x
@@ -0,0 +1,324 @@
+# Dependencies: numpy
+"""
+NumPy backend for the Stam solver in solver.py.
+
+Fields are (N + 2, N + 2) float arrays indexed as x[i, j], so that
+x.ravel(order='F')[IX(i, j)] is the same cell as the list backend's x[IX(i, j)].
+Use from_list() / to_list() to move data between the two layouts.
+
+lin_solve keeps the lexicographic Gauss-Seidel ordering of the list version by
+sweeping anti-diagonals (every cell on a diagonal only depends on the diagonal
+before it, which is already updated, and the diagonal after it, which is not).
+Every other stage is plain array slicing with the same operation order, so a
+velocity_step matches the list backend to within TOLERANCE (max abs difference
+per cell); in practice the results are bit-identical.
+
+That fixed 20-sweep solve is the default ('gauss_seidel'). set_linear_solver()
+switches lin_solve to one of the residual-driven solvers, which iterate until
+the relative residual drops below SOLVER_TOLERANCE (or SOLVER_MAX_ITERATIONS):
+
+    'red_black'   red-black Gauss-Seidel, one vectorized half-sweep per colour
+    'multigrid'   geometric V-cycles (red-black smoothing, cell-centred transfers)
+    'cg'          conjugate gradient on the same boundary-folded operator
+
+Every lin_solve appends a SolveStats to step_stats, which velocity_step clears,
+so callers can read iteration counts and residuals for the last step.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from solver import N, visc, diff, dt
+
+SHAPE = (N + 2, N + 2)
+TOLERANCE = 1e-9
+
+LINEAR_SOLVERS = ('gauss_seidel', 'red_black', 'multigrid', 'cg')
+LINEAR_SOLVER = 'gauss_seidel'
+SOLVER_TOLERANCE = 1e-4
+SOLVER_MAX_ITERATIONS = 200
+
+SolveStats = namedtuple('SolveStats', ['solver', 'b', 'iterations', 'residual'])
+step_stats = []
+
+# Interior cells grouped by anti-diagonal i + j, in sweep order. In the
+# flattened (C order) array a diagonal is a strided slice with step N + 1,
+# and its four neighbours are the same slice shifted by +-1 and +-(N + 2).
+_S = N + 2
+_diagonals = []
+for _k in range(2, 2 * N + 1):
+    _first = max(1, _k - N) * _S + _k - max(1, _k - N)
+    _last = min(N, _k - 1) * _S + _k - min(N, _k - 1)
+    _diagonals.append(tuple(slice(_first + o, _last + o + 1, _S - 1) for o in (0, -_S, _S, -1, 1)))
+
+
+def allocate():
+    return np.zeros(SHAPE)
+
+
+def from_list(x):
+    return np.ascontiguousarray(np.reshape(x, SHAPE, order='F'), dtype=float)
+
+
+def to_list(x):
+    return x.ravel(order='F').tolist()
+
+
+def field_value(x, i, j):
+    return x[i, j]
+
+
+def set_linear_solver(name, tolerance=None, max_iterations=None):
+    global LINEAR_SOLVER, SOLVER_TOLERANCE, SOLVER_MAX_ITERATIONS
+    if name not in LINEAR_SOLVERS:
+        raise ValueError("Unknown linear solver: %s" % name)
+    LINEAR_SOLVER = name
+    if tolerance is not None:
+        SOLVER_TOLERANCE = tolerance
+    if max_iterations is not None:
+        SOLVER_MAX_ITERATIONS = max_iterations
+
+
+def set_bnd(b, x):
+    # Indexed from the ends so the coarse multigrid levels can share it.
+    x[0, 1:-1] = -x[1, 1:-1] if b == 1 else x[1, 1:-1]
+    x[-1, 1:-1] = -x[-2, 1:-1] if b == 1 else x[-2, 1:-1]
+    x[1:-1, 0] = -x[1:-1, 1] if b == 2 else x[1:-1, 1]
+    x[1:-1, -1] = -x[1:-1, -2] if b == 2 else x[1:-1, -2]
+
+    x[0, 0] = 0.5 * (x[1, 0] + x[0, 1])
+    x[0, -1] = 0.5 * (x[1, -1] + x[0, -2])
+    x[-1, 0] = 0.5 * (x[-2, 0] + x[-1, 1])
+    x[-1, -1] = 0.5 * (x[-2, -1] + x[-1, -2])
+
+
+def add_source(x, s):
+    x += dt * s
+
+
+def lin_solve(b, x, x0, a, c):
+    if LINEAR_SOLVER == 'gauss_seidel':
+        iterations = 20
+        _gauss_seidel(b, x, x0, a, c, iterations)
+    elif LINEAR_SOLVER == 'red_black':
+        iterations = _iterate(_red_black, b, x, x0, a, c)
+    elif LINEAR_SOLVER == 'multigrid':
+        iterations = _iterate(_v_cycle, b, x, x0, a, c)
+    else:
+        iterations = _conjugate_gradient(b, x, x0, a, c)
+
+    step_stats.append(SolveStats(LINEAR_SOLVER, b, iterations, _relative_residual(b, x, x0, a, c)))
+
+
+def _gauss_seidel(b, x, x0, a, c, iterations):
+    # Fields must be C-contiguous so these are views, not copies.
+    xf = x.reshape(-1)
+    x0f = x0.reshape(-1)
+    for k in range(iterations):
+        for d, left, right, down, up in _diagonals:
+            xf[d] = (x0f[d] + a * (xf[left] + xf[right] + xf[down] + xf[up])) / c
+
+        set_bnd(b, x)
+
+
+def _is_singular(b, a, c):
+    # The pure Neumann pressure system only determines x up to a constant,
+    # so the constant part of the residual can never be removed.
+    return b == 0 and c == 4 * a
+
+
+def _residual(b, x, x0, a, c):
+    # Expects the boundary of x to be set.
+    r = x0[1:-1, 1:-1] - (c * x[1:-1, 1:-1] - a * (x[:-2, 1:-1] + x[2:, 1:-1] + x[1:-1, :-2] + x[1:-1, 2:]))
+    if _is_singular(b, a, c):
+        r -= r.mean()
+    return r
+
+
+def _relative_residual(b, x, x0, a, c):
+    rhs = x0[1:-1, 1:-1]
+    scale = np.linalg.norm(rhs - rhs.mean() if _is_singular(b, a, c) else rhs)
+    r = np.linalg.norm(_residual(b, x, x0, a, c))
+    return r / scale if scale > 0 else r
+
+
+def _iterate(cycle, b, x, x0, a, c):
+    if _is_singular(b, a, c):
+        # Smooth against the consistent part of the right-hand side only,
+        # otherwise the iterates drift along the null space and stall.
+        x0 = x0.copy()
+        x0[1:-1, 1:-1] -= x0[1:-1, 1:-1].mean()
+    set_bnd(b, x)
+    for k in range(SOLVER_MAX_ITERATIONS):
+        if _relative_residual(b, x, x0, a, c) < SOLVER_TOLERANCE:
+            return k
+        cycle(b, x, x0, a, c)
+    return SOLVER_MAX_ITERATIONS
+
+
+def _colour_slices(n):
+    # (cell, left, right, down, up) slices for the four parity classes of an
+    # n x n interior, red (i + j even) first.
+    slices = []
+    for p, q in ((1, 1), (2, 2), (1, 2), (2, 1)):
+        rows = [slice(p + o, n + 1 + o, 2) for o in (0, -1, 1)]
+        cols = [slice(q + o, n + 1 + o, 2) for o in (0, -1, 1)]
+        slices.append(((rows[0], cols[0]), (rows[1], cols[0]), (rows[2], cols[0]),
+                       (rows[0], cols[1]), (rows[0], cols[2])))
+    return slices
+
+
+_colour_cache = {}
+
+
+def _red_black(b, x, x0, a, c):
+    n = x.shape[0] - 2
+    if n not in _colour_cache:
+        _colour_cache[n] = _colour_slices(n)
+    for d, left, right, down, up in _colour_cache[n]:
+        x[d] = (x0[d] + a * (x[left] + x[right] + x[down] + x[up])) / c
+    set_bnd(b, x)
+
+
+def _restrict(r):
+    return 0.25 * (r[0::2, 0::2] + r[1::2, 0::2] + r[0::2, 1::2] + r[1::2, 1::2])
+
+
+def _prolong(e):
+    # Bilinear interpolation of a coarse field (with its boundary set) onto
+    # the interior of the next finer cell-centred grid.
+    m = e.shape[0] - 2
+    rows = np.empty((2 * m, m + 2))
+    rows[0::2] = 0.75 * e[1:-1] + 0.25 * e[:-2]
+    rows[1::2] = 0.75 * e[1:-1] + 0.25 * e[2:]
+    fine = np.empty((2 * m, 2 * m))
+    fine[:, 0::2] = 0.75 * rows[:, 1:-1] + 0.25 * rows[:, :-2]
+    fine[:, 1::2] = 0.75 * rows[:, 1:-1] + 0.25 * rows[:, 2:]
+    return fine
+
+
+def _v_cycle(b, x, x0, a, c, smoothing=2):
+    n = x.shape[0] - 2
+    if n <= 4 or n % 2:
+        for k in range(4 * n):
+            _red_black(b, x, x0, a, c)
+        return
+
+    for k in range(smoothing):
+        _red_black(b, x, x0, a, c)
+
+    # a scales with 1 / h^2, so it quarters on the coarse grid while the
+    # diagonal shift c - 4a stays the same.
+    coarse_a = a / 4
+    coarse_c = c - 3 * a
+    rc = np.zeros((n // 2 + 2, n // 2 + 2))
+    rc[1:-1, 1:-1] = _restrict(_residual(b, x, x0, a, c))
+    ec = np.zeros_like(rc)
+    _v_cycle(b, ec, rc, coarse_a, coarse_c, smoothing)
+    set_bnd(b, ec)
+    x[1:-1, 1:-1] += _prolong(ec)
+    set_bnd(b, x)
+
+    for k in range(smoothing):
+        _red_black(b, x, x0, a, c)
+
+
+def _conjugate_gradient(b, x, x0, a, c):
+    work = np.zeros_like(x)
+
+    def apply(p):
+        work[1:-1, 1:-1] = p
+        set_bnd(b, work)
+        return c * p - a * (work[:-2, 1:-1] + work[2:, 1:-1] + work[1:-1, :-2] + work[1:-1, 2:])
+
+    singular = _is_singular(b, a, c)
+    rhs = x0[1:-1, 1:-1] - x0[1:-1, 1:-1].mean() if singular else x0[1:-1, 1:-1]
+    target = SOLVER_TOLERANCE * np.linalg.norm(rhs)
+
+    u = x[1:-1, 1:-1].copy()
+    r = rhs - apply(u)
+    if singular:
+        r -= r.mean()
+    p = r.copy()
+    rr = np.vdot(r, r)
+    iterations = 0
+    while iterations < SOLVER_MAX_ITERATIONS and np.sqrt(rr) > target:
+        ap = apply(p)
+        alpha = rr / np.vdot(p, ap)
+        u += alpha * p
+        r -= alpha * ap
+        rr, rr_old = np.vdot(r, r), rr
+        p = r + (rr / rr_old) * p
+        iterations += 1
+
+    x[1:-1, 1:-1] = u
+    set_bnd(b, x)
+    return iterations
+
+
+def diffuse(b, x, x0):
+    a = dt * diff * N * N
+    lin_solve(b, x, x0, a, 1 + 4 * a)
+
+
+def advect(b, d, d0, u, v):
+    dt0 = dt * N
+    i, j = np.mgrid[1:N + 1, 1:N + 1]
+
+    x = np.clip(i - dt0 * u[1:-1, 1:-1], 0.5, N + 0.5)
+    y = np.clip(j - dt0 * v[1:-1, 1:-1], 0.5, N + 0.5)
+    i0 = x.astype(int)
+    i1 = i0 + 1
+    j0 = y.astype(int)
+    j1 = j0 + 1
+
+    s1 = x - i0
+    s0 = 1 - s1
+    t1 = y - j0
+    t0 = 1 - t1
+
+    d[1:-1, 1:-1] = s0 * (t0 * d0[i0, j0] + t1 * d0[i0, j1]) + s1 * (t0 * d0[i1, j0] + t1 * d0[i1, j1])
+
+    set_bnd(b, d)
+
+
+def project(u, v, p, div):
+    div[1:-1, 1:-1] = -0.5 * (u[2:, 1:-1] - u[:-2, 1:-1] + v[1:-1, 2:] - v[1:-1, :-2]) / N
+    p[1:-1, 1:-1] = 0.
+
+    set_bnd(0, div)
+    set_bnd(0, p)
+
+    lin_solve(0, p, div, 1, 4)
+
+    u[1:-1, 1:-1] -= 0.5 * N * (p[2:, 1:-1] - p[:-2, 1:-1])
+    v[1:-1, 1:-1] -= 0.5 * N * (p[1:-1, 2:] - p[1:-1, :-2])
+
+    set_bnd(1, u)
+    set_bnd(2, v)
+
+
+def velocity_step(u, v, u0, v0):
+    step_stats.clear()
+    v0[int(N / 2 + 1), int(N / 2 + 1)] = 5.
+
+    add_source(u, u0)
+    add_source(v, v0)
+
+    if diff > 0:
+        u0, u = u, u0
+        diffuse(1, u, u0)
+        v0, v = v, v0
+        diffuse(2, v, v0)
+
+    project(u, v, u0, v0)
+
+    u0, u = u, u0
+    v0, v = v, v0
+
+    advect(1, u, u0, u0, v0)
+    advect(2, v, v0, u0, v0)
+    project(u, v, u0, v0)
+
+    return u, v, u0, v0
@@ -0,0 +1,143 @@
+"""
+Compact binary recordings of game sessions, for replaying them deterministically.
+
+A recording holds what the simulation needs to run the session again: for
+every frame, the number of physics steps, the input events and the bodies
+removed outside the step. Periodic keyframes of every body's position,
+angle, velocity and angular velocity are added so a replay can check that
+it stays on track.
+
+The file is a short header followed by a stream of records:
+
+    MAGIC, uint32 header length, JSON header
+    uint8 kind, uint32 payload length, payload
+        FRAME     uint32 steps, uint32 removed, uint16 events...
+        KEYFRAME  uint64 step, uint32 bodies, float64 (bodies, 6) state, zlib compressed if the header says so
+
+    with SessionRecorder("session.rec", seed=seed) as recorder:
+        while running:
+            ...
+            recorder.frame(steps, [event.value for event in events], removed)
+            if recorder.keyframe_due(loop.total_steps):
+                recorder.keyframe(loop.total_steps, capture_state(space))
+
+    header, records = read_session("session.rec")
+"""
+import json
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+import pymunk.batch
+
+MAGIC = b"PMREC\x01"
+FRAME = 1
+KEYFRAME = 2
+KEYFRAME_PERIOD = 120  # Steps between keyframes
+COMPRESSION_LEVEL = 6
+
+RECORD = struct.Struct("<BI")
+FRAME_HEADER = struct.Struct("<II")
+KEYFRAME_HEADER = struct.Struct("<QI")
+
+STATE_FIELDS = (pymunk.batch.BodyFields.POSITION | pymunk.batch.BodyFields.ANGLE
+                | pymunk.batch.BodyFields.VELOCITY | pymunk.batch.BodyFields.ANGULAR_VELOCITY)
+STATE_COLUMNS = 6
+
+Frame = namedtuple("Frame", "steps removed events")
+Keyframe = namedtuple("Keyframe", "step state")
+
+
+def capture_state(space, buffer=None):
+    """
+    :return: (bodies, 6) array of x, y, angle, velocity x, velocity y and angular velocity, in space iteration order.
+    """
+    if buffer is None:
+        buffer = pymunk.batch.Buffer()
+    buffer.clear()
+    pymunk.batch.get_space_bodies(space, STATE_FIELDS, buffer)
+    return np.frombuffer(buffer.float_buf(), dtype=np.float64).reshape(-1, STATE_COLUMNS).copy()
+
+
+class SessionRecorder:
+    def __init__(self, path, keyframe_period=KEYFRAME_PERIOD, compress=True, **header):
+        """
+        :param header: Anything the replay needs to set up the session, e.g. the random seed, stored as JSON.
+        """
+        self.keyframe_period = keyframe_period
+        self.compress = compress
+        self.next_keyframe = 0
+        self.frames = 0
+        self.file = open(path, "wb")
+        header = json.dumps({**header, "keyframe_period": keyframe_period,
+                             "compression": "zlib" if compress else None}).encode()
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def frame(self, steps, events=(), removed=0):
+        """
+        :param steps: Physics steps run this frame.
+        :param events: Input event codes handled this frame, each 0 to 65535.
+        :param removed: Bodies removed outside the physics step this frame.
+        """
+        payload = FRAME_HEADER.pack(steps, removed) + np.asarray(events, dtype="<u2").tobytes()
+        self.file.write(RECORD.pack(FRAME, len(payload)) + payload)
+        self.frames += 1
+
+    def keyframe_due(self, step):
+        return step >= self.next_keyframe
+
+    def keyframe(self, step, state):
+        """:param state: Body state after step, see capture_state()."""
+        data = np.ascontiguousarray(state, dtype="<f8").tobytes()
+        if self.compress:
+            data = zlib.compress(data, COMPRESSION_LEVEL)
+        payload = KEYFRAME_HEADER.pack(step, len(state)) + data
+        self.file.write(RECORD.pack(KEYFRAME, len(payload)) + payload)
+        self.next_keyframe = step + self.keyframe_period
+
+
+def read_session(path):
+    """
+    :return: (header dict, list of Frame and Keyframe records in the order they were written)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a session recording")
+    offset = len(MAGIC)
+    (length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    header = json.loads(data[offset:offset + length])
+    offset += length
+
+    records = []
+    while offset < len(data):
+        if offset + RECORD.size > len(data):
+            break
+        kind, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break  # Cut short, e.g. the game crashed mid-write
+        payload = data[offset:offset + length]
+        offset += length
+        if kind == FRAME:
+            steps, removed = FRAME_HEADER.unpack_from(payload)
+            events = np.frombuffer(payload, dtype="<u2", offset=FRAME_HEADER.size).tolist()
+            records.append(Frame(steps, removed, events))
+        elif kind == KEYFRAME:
+            step, count = KEYFRAME_HEADER.unpack_from(payload)
+            state = payload[KEYFRAME_HEADER.size:]
+            if header.get("compression") == "zlib":
+                state = zlib.decompress(state)
+            records.append(Keyframe(step, np.frombuffer(state, dtype="<f8").reshape(count, STATE_COLUMNS)))
+    return header, records
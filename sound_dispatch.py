@@ -0,0 +1,110 @@
+"""
+Collision sounds gathered during physics steps and played in a batch afterwards.
+
+Collision callbacks submit() an impact with its energy instead of playing a
+sound, which only updates a dict. Impacts are merged per sound, keeping the
+highest energy, until the dispatch window has passed. dispatch() then plays
+the loudest few of them on a set of reserved mixer channels. When every
+reserved channel is busy, the voice with the least energy left, decaying with
+age, is stopped for a louder impact, and quieter impacts are dropped.
+
+    audio = SoundDispatcher(counter=profiler.count)
+    audio.reserve(16)
+
+    def brick_ball_collide(arbiter, space, data):
+        audio.submit(bounce_sound, arbiter.shapes[1].body.kinetic_energy)
+        return True
+
+    while running:
+        loop.advance(frame_time)
+        audio.dispatch()
+
+Sounds are anything with a play(channel=...) method that returns whether
+they played, such as brick_knocker.BlindSound. The counter, if given, hears
+how many impacts each dispatch submitted, played, stole channels for and
+dropped.
+"""
+import time
+
+import pygame
+
+DISPATCH_WINDOW_SEC = 0.05  # Impacts of the same sound within a window play once
+MAX_PLAYS_PER_WINDOW = 4
+VOICE_HALF_LIFE_SEC = 0.25  # A playing voice counts for half its energy after this long, when stealing
+
+
+class SoundDispatcher:
+    def __init__(self, window=DISPATCH_WINDOW_SEC, max_plays=MAX_PLAYS_PER_WINDOW,
+                 half_life=VOICE_HALF_LIFE_SEC, counter=None):
+        """
+        :param counter: Called with (counter name, impacts) after each dispatch, e.g. FrameProfiler.count.
+        """
+        self.window = window
+        self.max_plays = max_plays
+        self.half_life = half_life
+        self.pending = {}  # Highest energy submitted per sound since the last dispatch
+        self.last_dispatch = float("-inf")
+
+        self.channels = []
+        self.voices = []  # (energy, start time) last played on each channel
+
+        self.counter = counter
+        self.submitted = 0  # Impacts submitted since the last dispatch
+
+    def reserve(self, count):
+        """Reserves the first count mixer channels for dispatched sounds, Sound.play() leaves them alone."""
+        pygame.mixer.set_reserved(count)
+        self.channels = [pygame.mixer.Channel(i) for i in range(count)]
+        self.voices = [(0.0, 0.0)] * count
+
+    def submit(self, sound, energy):
+        """Queues sound, e.g. from a collision callback, merged with earlier impacts of the same sound."""
+        self.submitted += 1
+        if energy > self.pending.get(sound, -1.0):
+            self.pending[sound] = energy
+
+    def dispatch(self, now=None):
+        """
+        Plays the loudest pending sounds, once a window has passed since the last dispatch.
+
+        :return: Number of sounds played.
+        """
+        now = time.perf_counter() if now is None else now
+        if not self.pending or now - self.last_dispatch < self.window:
+            return 0
+        self.last_dispatch = now
+
+        loudest = sorted(self.pending.items(), key=lambda item: item[1], reverse=True)
+        self.pending.clear()
+        submitted, self.submitted = self.submitted, 0
+        dropped = max(len(loudest) - self.max_plays, 0)
+
+        played = stolen = 0
+        for sound, energy in loudest[:self.max_plays]:
+            channel = self._channel(energy, now)
+            if channel is None:
+                dropped += 1
+                continue
+            stolen += self.channels[channel].get_busy()
+            if sound.play(channel=self.channels[channel]):
+                self.voices[channel] = (energy, now)
+                played += 1
+
+        if self.counter is not None:
+            for name, count in (("impacts submitted", submitted), ("impacts played", played),
+                                ("impacts stolen", stolen), ("impacts dropped", dropped)):
+                if count:
+                    self.counter(name, count)
+        return played
+
+    def _channel(self, energy, now):
+        """:return: Index of a free channel, or of the quietest voice quieter than energy, or None."""
+        quietest, quietest_energy = None, energy
+        for i, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                return i
+            voice_energy, start = self.voices[i]
+            voice_energy *= 0.5 ** ((now - start) / self.half_life)
+            if voice_energy < quietest_energy:
+                quietest, quietest_energy = i, voice_energy
+        return quietest
@@ -0,0 +1,264 @@
+"""
+Batched sprite drawing for pymunk spaces, in place of space.debug_draw.
+
+Each distinct shape (circle radius, polygon outline, color) is drawn once per
+rotation bucket into a cached surface, in the same style as debug_draw. Every
+frame, the body positions and angles come in as arrays (see
+FixedTimestep.state), numpy works out each body's cached frame and top-left
+corner, and everything is drawn with a single Surface.blits call. Bodies whose
+shapes are not cached, e.g. segments or the static body, are drawn the way
+debug_draw draws them.
+
+Given a Camera, only the bodies in its view are drawn, moved and scaled to
+the screen, and sprites are cached per zoom level as well. When little of
+the world is in view, the bodies in view come from a query of the space's
+spatial index, whose cost grows with what is in view. When much of it is,
+every body position is tested against the view with numpy instead, as the
+index query costs far more per shape.
+
+    renderer = SpriteRenderer(space)
+    renderer.draw(screen, *loop.state(), camera=camera)
+"""
+import math
+import weakref
+
+import numpy as np
+import pygame
+import pymunk
+import pymunk.pygame_util
+from pymunk import Vec2d
+
+from entity_store import find_ids
+
+ROTATION_BUCKETS = 64  # Cached frames per full turn, angles are rounded to the nearest
+SPRITE_PADDING = 2
+QUERY_RATIO = 50  # Bodies per body in view above which the spatial index is queried for the view
+COLOR_KEY = (255, 0, 255)  # Transparent sprite background, colorkeyed blits are much faster than per-pixel alpha
+
+UNKNOWN = -2
+UNCACHED = -1
+
+
+class SpriteRenderer:
+    def __init__(self, space, buckets=ROTATION_BUCKETS):
+        self.space = space
+        self.buckets = buckets
+        self.options = None
+        self.options_surface = None
+
+        # Frames of every sprite at the current scale, buckets consecutive entries per sprite, with
+        # the offset of each frame's top-left corner from the body position.
+        self.frames = []
+        self.offsets = np.empty((0, 2))
+        self.sizes = np.empty((0, 2), dtype=int)
+        self.scale = 1.0
+        self.tables = {}  # (frames, offsets, sizes) of the other scales drawn at
+        self.sprite_shapes = []  # Shape each sprite was made from, to draw it at other scales
+
+        self.sprite_of_key = {}
+        self.sprite_of_body = {}
+        self.uncached = {}
+
+        # Sprite per body of the last frame, reused while the bodies stay the same.
+        self.last_ids = np.empty(0, dtype=np.uintp)
+        self.last_sprite = np.empty(0, dtype=np.intp)
+        self.last_order = None  # Rows of last_ids sorted by id, to find bodies in view
+        self.in_view = 0  # Bodies in view of the camera in the last frame
+
+    @property
+    def sprite_count(self):
+        return len(self.sprite_of_key)
+
+    def forget(self, body_id):
+        """Drops the cached sprite of a body, e.g. after its shapes changed."""
+        self.sprite_of_body.pop(body_id, None)
+        self.uncached.pop(body_id, None)
+        self.last_ids = self.last_ids[:0]
+
+    def draw(self, surface, ids, state, camera=None):
+        """
+        Draws every body in the space, or every body in view of camera.
+
+        :param ids: Body ids, as returned by FixedTimestep.state().
+        :param state: Matching (bodies, 3) array of x, y and angle.
+        :param camera: Camera to draw through, see camera.Camera.
+        """
+        self._options(surface)
+        self._set_scale(1.0 if camera is None else camera.zoom)
+        if len(ids) == 0:
+            return
+        if np.array_equal(ids, self.last_ids):
+            sprite = self.last_sprite
+        else:
+            sprite = np.fromiter((self.sprite_of_body.get(i, UNKNOWN) for i in ids.tolist()), dtype=np.intp,
+                                 count=len(ids))
+            unknown = sprite == UNKNOWN
+            if unknown.any():
+                self._discover(set(ids[unknown].tolist()))
+                sprite[unknown] = [self.sprite_of_body[i] for i in ids[unknown].tolist()]
+            self.last_ids, self.last_sprite, self.last_order = ids.copy(), sprite, None
+
+        if camera is not None:
+            if self.in_view * QUERY_RATIO < len(ids):
+                rows = self._rows(ids, camera.visible(self.space))
+            else:
+                # Uncached bodies such as the static one can have shapes in view whatever their position.
+                rows = np.flatnonzero(camera.contains(state[:, :2]) | (sprite < 0))
+            self.in_view = len(rows)
+            ids, state, sprite = ids[rows], state[rows], sprite[rows]
+
+        cached = sprite >= 0
+        if not cached.all():
+            self._draw_uncached(ids[~cached], state[~cached], camera)
+            sprite, state = sprite[cached], state[cached]
+
+        bucket = np.rint(state[:, 2] * (self.buckets / (2 * math.pi))).astype(np.intp) % self.buckets
+        frame = sprite + bucket
+        if camera is not None:
+            position = camera.to_screen(state[:, :2])
+        else:
+            position = state[:, :2].copy()
+            if pymunk.pygame_util.positive_y_is_up:
+                position[:, 1] = surface.get_height() - position[:, 1]
+        corner = np.rint(position + self.offsets[frame]).astype(np.intp)
+
+        size = self.sizes[frame]
+        visible = ((corner < surface.get_size()) & (corner + size > 0)).all(axis=1)
+        frames = self.frames
+        surface.blits(zip([frames[f] for f in frame[visible].tolist()], corner[visible].tolist()), doreturn=False)
+
+    def _rows(self, ids, visible):
+        """:return: Rows of ids found in visible, in order, looked up in time growing with the visible ids."""
+        if self.last_order is None:
+            self.last_order = np.argsort(ids)
+        index, found = find_ids(ids, visible, self.last_order)
+        rows = index[found]
+        rows.sort()
+        return rows
+
+    def _options(self, surface):
+        if self.options_surface is not surface:
+            self.options = pymunk.pygame_util.DrawOptions(surface)
+            self.options_surface = surface
+        return self.options
+
+    def _discover(self, ids):
+        """Finds the sprite of each new body, once per body."""
+        # Body ids are only unique among live bodies, so forget each one when it goes.
+        for body in (*self.space.bodies, self.space.static_body):
+            if body.id not in ids:
+                continue
+            weakref.finalize(body, self.forget, body.id)
+            shapes = list(body.shapes)
+            key = self._key(shapes[0]) if len(shapes) == 1 and body.body_type != pymunk.Body.STATIC else None
+            if key is None:
+                self.sprite_of_body[body.id] = UNCACHED
+                self.uncached[body.id] = weakref.ref(body)
+                continue
+            if key not in self.sprite_of_key:
+                self.sprite_of_key[key] = self._add_sprite(shapes[0])
+            self.sprite_of_body[body.id] = self.sprite_of_key[key]
+
+    def _key(self, shape):
+        color = tuple(self.options.color_for_shape(shape))
+        if isinstance(shape, pymunk.Circle):
+            return 'circle', shape.radius, tuple(shape.offset), color
+        if isinstance(shape, pymunk.Poly):
+            return 'poly', tuple(tuple(v) for v in shape.get_vertices()), shape.radius, color
+        return None
+
+    def _add_sprite(self, shape):
+        self.sprite_shapes.append(shape)
+        self._render_sprites()
+        return (len(self.sprite_shapes) - 1) * self.buckets
+
+    def _set_scale(self, scale):
+        """Switches the frames to those of scale, drawing any sprite missing at that scale."""
+        if scale == self.scale:
+            return
+        self.tables[self.scale] = self.frames, self.offsets, self.sizes
+        self.frames, self.offsets, self.sizes = self.tables.pop(
+            scale, ([], np.empty((0, 2)), np.empty((0, 2), dtype=int)))
+        self.scale = scale
+        self._render_sprites()
+
+    def _render_sprites(self):
+        """Draws the frames of the sprites added since the frames of the current scale were drawn."""
+        offsets, sizes = [], []
+        for shape in self.sprite_shapes[len(self.frames) // self.buckets:]:
+            for bucket in range(self.buckets):
+                frame, offset = self._render(shape, bucket * 2 * math.pi / self.buckets)
+                self.frames.append(frame)
+                offsets.append(offset)
+                sizes.append(frame.get_size())
+        if offsets:
+            self.offsets = np.concatenate((self.offsets, offsets))
+            self.sizes = np.concatenate((self.sizes, sizes))
+
+    def _render(self, shape, angle):
+        """
+        Draws shape rotated by angle, at the current scale, in screen orientation.
+
+        :return: (surface, offset of its top-left corner from the body position)
+        """
+        fill = self.options.color_for_shape(shape).as_int()
+        outline = self.options.shape_outline_color.as_int()
+
+        scale = self.scale
+        if isinstance(shape, pymunk.Circle):
+            center = shape.offset.rotated(angle) * scale
+            points = [center, center + Vec2d.from_polar(shape.radius * scale, angle)]
+            extent = shape.radius * scale
+        else:
+            points = [v.rotated(angle) * scale for v in shape.get_vertices()]
+            extent = shape.radius * scale
+        if pymunk.pygame_util.positive_y_is_up:
+            points = [Vec2d(p.x, -p.y) for p in points]
+
+        low = np.floor(np.min(points, axis=0) - extent) - SPRITE_PADDING
+        high = np.ceil(np.max(points, axis=0) + extent) + SPRITE_PADDING
+        sprite = pygame.Surface((high - low).astype(int))
+        sprite.fill(COLOR_KEY)
+        sprite.set_colorkey(COLOR_KEY, pygame.RLEACCEL)
+        local = [(round(p.x - low[0]), round(p.y - low[1])) for p in points]
+
+        if isinstance(shape, pymunk.Circle):
+            pygame.draw.circle(sprite, fill, local[0], round(extent), 0)
+            pygame.draw.lines(sprite, outline, False, local, 2 if extent > 20 else 1)
+        else:
+            pygame.draw.polygon(sprite, fill, local)
+            if extent > 0:
+                pygame.draw.lines(sprite, outline, True, local, round(max(1, extent * 2)))
+
+        return sprite.convert(self.options_surface), low
+
+    def _draw_uncached(self, ids, state, camera=None):
+        options = self.options
+        scale = self.scale
+        height = self.options_surface.get_height()
+
+        def place(points):
+            if camera is None:
+                return points
+            screen = camera.to_screen(points)
+            if pymunk.pygame_util.positive_y_is_up:
+                screen[:, 1] = height - screen[:, 1]  # DrawOptions flips them back
+            return [Vec2d(*point) for point in screen.tolist()]
+
+        for body_id, (x, y, angle) in zip(ids.tolist(), state.tolist()):
+            position = Vec2d(x, y)
+            # Shapes are looked up every frame, the static body gains and loses them.
+            for shape in self.uncached[body_id]().shapes:
+                if shape.space is not self.space:
+                    continue
+                outline = options.shape_outline_color
+                fill = options.color_for_shape(shape)
+                if isinstance(shape, pymunk.Segment):
+                    a, b = place([position + shape.a.rotated(angle), position + shape.b.rotated(angle)])
+                    options.draw_fat_segment(a, b, shape.radius * scale, outline, fill)
+                elif isinstance(shape, pymunk.Circle):
+                    (center,) = place([position + shape.offset.rotated(angle)])
+                    options.draw_circle(center, angle, shape.radius * scale, outline, fill)
+                elif isinstance(shape, pymunk.Poly):
+                    options.draw_polygon(place([position + v.rotated(angle) for v in shape.get_vertices()]),
+                                         shape.radius * scale, outline, fill)
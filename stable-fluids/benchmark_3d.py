@@ -0,0 +1,64 @@
+"""
+Seconds per step and peak RSS of 3D Fluid volumes.
+
+Each configuration runs in a process of its own, see output.peak_rss_mb.
+
+    python benchmark_3d.py                      # 64^3 and 128^3, both pressure methods
+    python benchmark_3d.py --sizes 96 --steps 10 --dtype float32
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fluid import Fluid
+from output import peak_rss_mb
+
+INFLOW_RADIUS = 0.1  # Fraction of the grid size.
+INFLOW_VELOCITY = 1
+
+
+def run(size, steps, pressure_method, advect_order, dtype):
+    shape = (size,) * 3
+    start_time = time.perf_counter()
+    fluid = Fluid(shape, 'dye', pressure_method=pressure_method, advect_order=advect_order,
+                  dtype=dtype, inplace=True, cache_directory=None)
+    setup = time.perf_counter() - start_time
+
+    # A single jet along the first axis from the middle of the volume.
+    center = np.array(shape)[:, None, None, None] / 2
+    mask = np.linalg.norm(fluid.indices - center, axis=0) <= INFLOW_RADIUS * size
+
+    durations = []
+    for _ in range(steps):
+        fluid.velocity[0][mask] += INFLOW_VELOCITY
+        fluid.dye[mask] = 1
+
+        start_time = time.perf_counter()
+        fluid.step()
+        durations.append(time.perf_counter() - start_time)
+
+    return setup, float(np.mean(durations)), peak_rss_mb()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 128])
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--pressure-methods', nargs='+', default=['direct', 'spectral'])
+    parser.add_argument('--advect-order', type=int, default=3)
+    parser.add_argument('--dtype', default='float64')
+    args = parser.parse_args()
+
+    print(f'{"grid":>8} {"pressure":>9} {"setup s":>8} {"s/step":>8} {"peak RSS MB":>12}')
+    for size in args.sizes:
+        for method in args.pressure_methods:
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                setup, per_step, peak_rss = pool.submit(run, size, args.steps, method,
+                                                        args.advect_order, args.dtype).result()
+            print(f'{f"{size}^3":>8} {method:>9} {setup:8.2f} {per_step:8.3f} {peak_rss:12.0f}')
+
+
+if __name__ == '__main__':
+    main()
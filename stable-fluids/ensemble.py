@@ -0,0 +1,206 @@
+"""
+Runs many inflow scenarios (see scenario.py) in parallel, one Fluid per task.
+
+Pressure solvers are built once per grid shape in the parent and written to
+the solver cache, and every worker memory-maps the same files, so the pages
+are shared between processes rather than copied. Workers run single threaded
+BLAS so that N workers use N cores instead of oversubscribing them.
+
+    python ensemble.py --inflow-count 3 5 --inflow-velocity 0.5 1 --advect-order 1 3 --workers 4
+"""
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+import numpy as np
+
+import scenario
+from fluid import Fluid
+from output import write_metadata
+from pressure import CACHE_DIRECTORY, load_pressure_solver
+
+DEFAULTS = {
+    'resolution': (200, 200),
+    'duration': 200,
+    'inflow_duration': scenario.INFLOW_DURATION,
+    'inflow_padding': scenario.INFLOW_PADDING,
+    'inflow_radius': scenario.INFLOW_RADIUS,
+    'inflow_velocity': scenario.INFLOW_VELOCITY,
+    'inflow_count': scenario.INFLOW_COUNT,
+    'advect_order': 3,
+    'pressure_order': 1,
+    'pressure_method': 'direct',
+    'dtype': 'float64',
+}
+
+# Environment variables read by the BLAS libraries numpy may be built against.
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+RunResult = namedtuple('RunResult', 'parameters metrics frames')
+
+
+def sweep(**axes):
+    """
+    Every combination of the given parameter values, as a list of parameter dicts.
+
+        sweep(inflow_count=[3, 5], advect_order=[1, 3])
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def run(parameters, fields=(), frame_period=1, cache_directory=CACHE_DIRECTORY):
+    """
+    Runs a single scenario and returns its RunResult.
+
+    :param parameters: Overrides for DEFAULTS.
+    :param fields: Fields to record, any of 'dye', 'velocity', 'curl', 'pressure' and 'divergence'.
+    :param frame_period: Record every frame_period-th frame.
+    """
+    parameters = {**DEFAULTS, **parameters}
+    resolution = tuple(parameters['resolution'])
+
+    start_time = time.perf_counter()
+    fluid = Fluid(resolution, 'dye', pressure_order=parameters['pressure_order'],
+                  advect_order=parameters['advect_order'], pressure_method=parameters['pressure_method'],
+                  cache_directory=cache_directory, dtype=parameters['dtype'], inplace=True)
+    inflow_velocity, inflow_dye = scenario.inflow(fluid, parameters['inflow_padding'], parameters['inflow_radius'],
+                                                  parameters['inflow_velocity'], parameters['inflow_count'])
+    setup = time.perf_counter() - start_time
+
+    frames = {name: [] for name in fields}
+    max_divergence = max_curl = 0.0
+    start_time = time.perf_counter()
+    for f in range(parameters['duration']):
+        if f <= parameters['inflow_duration']:
+            fluid.velocity += inflow_velocity
+            fluid.dye += inflow_dye
+
+        divergence, curl, pressure = fluid.step()
+        max_divergence = max(max_divergence, float(np.abs(divergence).max()))
+        max_curl = max(max_curl, float(np.abs(curl).max()))
+
+        if frames and f % frame_period == 0:
+            current = {'dye': fluid.dye, 'velocity': fluid.velocity, 'curl': curl,
+                       'pressure': pressure, 'divergence': divergence}
+            for name in fields:
+                frames[name].append(current[name].copy())
+    elapsed = time.perf_counter() - start_time
+
+    speed = np.linalg.norm(fluid.velocity, axis=0)
+    metrics = {
+        'setup_seconds': setup,
+        'seconds_per_step': elapsed / max(parameters['duration'], 1),
+        'kinetic_energy': float(0.5 * np.sum(speed ** 2)),
+        'max_speed': float(speed.max()),
+        'max_divergence': max_divergence,
+        'max_curl': max_curl,
+        'dye_total': float(fluid.dye.sum()),
+    }
+    frames = {name: np.stack(frames[name]) if frames[name] else np.empty((0, *resolution))
+              for name in fields}
+    return RunResult(parameters, metrics, frames)
+
+
+def _run_indexed(task):
+    index, parameters, fields, frame_period, cache_directory = task
+    return index, run(parameters, fields, frame_period, cache_directory)
+
+
+def prepare_solvers(configurations, cache_directory=CACHE_DIRECTORY):
+    """Builds the cached pressure solver of each distinct grid once, before any worker asks for it."""
+    if cache_directory is None:
+        return
+    keys = set()
+    for parameters in configurations:
+        parameters = {**DEFAULTS, **parameters}
+        if parameters['pressure_method'] == 'direct':
+            keys.add((tuple(parameters['resolution']), parameters['pressure_order']))
+    for shape, pressure_order in keys:
+        load_pressure_solver(shape, pressure_order, cache_directory=cache_directory)
+
+
+def run_ensemble(configurations, workers=None, fields=(), frame_period=1, cache_directory=CACHE_DIRECTORY):
+    """
+    Runs every parameter dict in configurations across a process pool.
+
+    Results come back in the order of configurations. With
+    cache_directory=None nothing is shared and each run builds its own
+    pressure solver.
+
+    :param workers: Pool size, defaults to the number of CPUs.
+    :param fields: Fields to record in each RunResult, see run().
+    :param frame_period: Record every frame_period-th frame.
+    """
+    configurations = list(configurations)
+    workers = min(workers or os.cpu_count(), len(configurations)) or 1
+    prepare_solvers(configurations, cache_directory)
+
+    tasks = [(i, parameters, tuple(fields), frame_period, cache_directory)
+             for i, parameters in enumerate(configurations)]
+    results = [None] * len(tasks)
+
+    # Spawned workers inherit the environment as it is when the pool starts,
+    # multiprocessing.Pool starts all of them up front.
+    saved = {name: os.environ.get(name) for name in THREAD_VARIABLES}
+    os.environ.update({name: '1' for name in THREAD_VARIABLES})
+    try:
+        pool = multiprocessing.get_context('spawn').Pool(workers)
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+    with pool:
+        for index, result in pool.imap_unordered(_run_indexed, tasks):
+            results[index] = result
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolution', type=int, nargs=2, default=list(DEFAULTS['resolution']))
+    parser.add_argument('--duration', type=int, default=DEFAULTS['duration'])
+    parser.add_argument('--inflow-count', type=int, nargs='+', default=[DEFAULTS['inflow_count']])
+    parser.add_argument('--inflow-velocity', type=float, nargs='+', default=[DEFAULTS['inflow_velocity']])
+    parser.add_argument('--advect-order', type=int, nargs='+', default=[DEFAULTS['advect_order']])
+    parser.add_argument('--pressure-order', type=int, nargs='+', default=[DEFAULTS['pressure_order']])
+    parser.add_argument('--pressure-method', default=DEFAULTS['pressure_method'])
+    parser.add_argument('--dtype', default=DEFAULTS['dtype'])
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--fields', nargs='*', default=[], help='Fields to save per run, needs --output.')
+    parser.add_argument('--frame-period', type=int, default=1)
+    parser.add_argument('--output', help='Directory for run_<n>.npz frames and metadata.json.')
+    args = parser.parse_args()
+
+    configurations = sweep(inflow_count=args.inflow_count, inflow_velocity=args.inflow_velocity,
+                           advect_order=args.advect_order, pressure_order=args.pressure_order)
+    for parameters in configurations:
+        parameters.update(resolution=tuple(args.resolution), duration=args.duration,
+                          pressure_method=args.pressure_method, dtype=args.dtype)
+
+    start_time = time.perf_counter()
+    results = run_ensemble(configurations, args.workers, args.fields if args.output else (), args.frame_period)
+    elapsed = time.perf_counter() - start_time
+
+    print(f'{"count":>5} {"velocity":>8} {"advect":>6} {"pressure":>8} {"s/step":>8} {"energy":>10} {"max curl":>9}')
+    for result in results:
+        p, m = result.parameters, result.metrics
+        print(f'{p["inflow_count"]:5d} {p["inflow_velocity"]:8.2f} {p["advect_order"]:6d} {p["pressure_order"]:8d} '
+              f'{m["seconds_per_step"]:8.4f} {m["kinetic_energy"]:10.1f} {m["max_curl"]:9.3f}')
+    print(f'{len(results)} runs in {elapsed:.1f} s')
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        for i, result in enumerate(results):
+            np.savez(os.path.join(args.output, f'run_{i}.npz'), **result.frames)
+        write_metadata(args.output, runs=[{'parameters': r.parameters, 'metrics': r.metrics} for r in results])
+
+
+if __name__ == '__main__':
+    main()
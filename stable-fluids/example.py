@@ -1,11 +1,11 @@
-import numpy as np
-from PIL import Image
-from scipy.special import erf
 # NICK
 import pygame
 import time
+from PIL import Image
 
 from fluid import Fluid
+from render import FieldRenderer
+from scenario import INFLOW_DURATION, inflow
 
 # RESOLUTION = 500, 500
 # RESOLUTION = 150, 150  # 50% of 60FPS budget
@@ -13,34 +13,16 @@ RESOLUTION = 100, 100  # 25%
 # RESOLUTION = 50, 50  # 8%
 DURATION = 200
 
-INFLOW_PADDING = 50
-INFLOW_DURATION = 60
-INFLOW_RADIUS = 8
-INFLOW_VELOCITY = 1
-INFLOW_COUNT = 5
-
 # NICK
 pygame.init()
 screen = pygame.display.set_mode((RESOLUTION[0], RESOLUTION[1]), pygame.RESIZABLE)
 start_time = time.time()
 
-print('Generating fluid solver, this may take some time.')
+print('Generating fluid solver, this is only slow the first time for a given resolution.')
 fluid = Fluid(RESOLUTION, 'dye')
 
-center = np.floor_divide(RESOLUTION, 2)
-r = np.min(center) - INFLOW_PADDING
-
-points = np.linspace(-np.pi, np.pi, INFLOW_COUNT, endpoint=False)
-points = tuple(np.array((np.cos(p), np.sin(p))) for p in points)
-normals = tuple(-p for p in points)
-points = tuple(r * p + center for p in points)
-
-inflow_velocity = np.zeros_like(fluid.velocity)
-inflow_dye = np.zeros(fluid.shape)
-for p, n in zip(points, normals):
-    mask = np.linalg.norm(fluid.indices - p[:, None, None], axis=0) <= INFLOW_RADIUS
-    inflow_velocity[:, mask] += n[:, None] * INFLOW_VELOCITY
-    inflow_dye[mask] = 1
+inflow_velocity, inflow_dye = inflow(fluid)
+renderer = FieldRenderer(RESOLUTION)
 
 end_time = time.time()
 duration = end_time - start_time
@@ -57,19 +39,13 @@ for f in range(DURATION):
         fluid.dye += inflow_dye
 
     curl = fluid.step()[1]
-    # Using the error function to make the contrast a bit higher.
-    # Any other sigmoid function e.g. smoothstep would work.
-    curl = (erf(curl * 2) + 1) / 4
-
-    color = np.dstack((curl, np.ones(fluid.shape), fluid.dye))
-    color = (np.clip(color, 0, 1) * 255).astype('uint8')
-    frames.append(Image.fromarray(color, mode='HSV').convert('RGB'))
+    surface = renderer.curl_dye(curl, fluid.dye)
+    frames.append(Image.frombytes('RGB', surface.get_size(), pygame.image.tobytes(surface, 'RGB')))
 
     # NICK
     pygame.event.get()
-    image = frames[len(frames) - 1]
-    py_image = pygame.image.fromstring(image.tobytes(), image.size, image.mode)
-    screen.blit(py_image, (0, 0))
+    # The window is resizable, present() scales the frame to fit it.
+    renderer.present(pygame.display.get_surface())
 
     end_time = time.time()
     duration = end_time - start_time
@@ -1,68 +1,91 @@
 # https://github.com/GregTJ/stable-fluids
 import numpy as np
-from scipy.ndimage import map_coordinates, spline_filter
-from scipy.sparse.linalg import factorized
 
-from numerical import difference, operator
+from advection import Advector
+from numerical import gradient
+from pressure import CACHE_DIRECTORY, SpectralSolver, load_pressure_solver
+
+PRESSURE_METHODS = ('direct', 'spectral')
 
 
 class Fluid:
-    def __init__(self, shape, *quantities, pressure_order=1, advect_order=3):
+    def __init__(self, shape, *quantities, pressure_order=1, advect_order=3,
+                 boundary='dirichlet', cache_directory=CACHE_DIRECTORY, pressure_method='direct',
+                 dtype=np.float64, inplace=False):
         self.shape = shape
         self.dimensions = len(shape)
+        self.dtype = np.dtype(dtype)
+
+        # With inplace=True, step() returns views of the work buffers below,
+        # which the next step overwrites, instead of fresh copies.
+        self.inplace = inplace
 
         # Prototyping is simplified by dynamically
         # creating advected quantities as needed.
         self.quantities = quantities
         for q in quantities:
-            setattr(self, q, np.zeros(shape))
+            setattr(self, q, np.zeros(shape, dtype=self.dtype))
 
-        self.indices = np.indices(shape)
-        self.velocity = np.zeros((self.dimensions, *shape))
+        self.indices = np.indices(shape, dtype=self.dtype)
+        self.velocity = np.zeros((self.dimensions, *shape), dtype=self.dtype)
 
-        laplacian = operator(shape, difference(2, pressure_order))
-        self.pressure_solver = factorized(laplacian)
+        if pressure_method not in PRESSURE_METHODS:
+            raise ValueError(f'Unknown pressure method: {pressure_method}')
+        if pressure_method == 'spectral':
+            self.pressure_solver = SpectralSolver(shape, pressure_order, boundary, self.dtype)
+        else:
+            # The inverse Laplacian is precomputed once per shape, pressure_order
+            # and boundary, and memory-mapped from disk on later runs.
+            self.pressure_solver = load_pressure_solver(shape, pressure_order, boundary, cache_directory,
+                                                        self.dtype)
 
         self.advect_order = advect_order
+        self.advector = Advector(shape, advect_order, dtype=self.dtype)
 
-    def step(self):
-        # Advection is computed backwards in time as described in Stable Fluids.
-        advection_map = self.indices - self.velocity
-
-        # SciPy's spline filter introduces checkerboard divergence.
-        # A linear blend of the filtered and unfiltered fields based
-        # on some value epsilon eliminates this error.
-        def advect(field, filter_epsilon=10e-2, mode='constant'):
-            filtered = spline_filter(field, order=self.advect_order, mode=mode)
-            field = filtered * (1 - filter_epsilon) + field * filter_epsilon
-            return map_coordinates(field, advection_map, prefilter=False, order=self.advect_order, mode=mode)
-
-        # Apply advection to each axis of the
-        # velocity field and each user-defined quantity.
-        for d in range(self.dimensions):
-            self.velocity[d] = advect(self.velocity[d])
+        # Curl components are jacobian[i, j] - jacobian[j, i] for each pair below.
+        # In 2D that is the scalar curl. In 3D the pairs are cyclic, so curl[d]
+        # is the component along axis d, laid out like velocity. These are the
+        # upper triangle components with the y-axis value negated (the
+        # coefficients of the levi-civita symbol), in reverse order.
+        # Higher dimensions do not have a vector -> scalar, or vector -> vector,
+        # correspondence between velocity and curl due to differing isomorphisms
+        # between exterior powers in dimensions != 2 or 3 respectively, so there
+        # the upper triangle of the antisymmetric part is returned as is.
+        if self.dimensions == 3:
+            self.curl_pairs = [(1, 2), (2, 0), (0, 1)]
+        else:
+            self.curl_pairs = [(i, j) for i in range(self.dimensions) for j in range(i + 1, self.dimensions)]
+
+        # Work buffers reused by every step.
+        self.jacobian = np.empty((self.dimensions, self.dimensions, *shape), dtype=self.dtype)
+        self.divergence = np.empty(shape, dtype=self.dtype)
+        self.curl = np.empty((len(self.curl_pairs), *shape), dtype=self.dtype)
+        self.pressure = np.empty(shape, dtype=self.dtype)
+        self.pressure_gradient = np.empty((self.dimensions, *shape), dtype=self.dtype)
 
-        for q in self.quantities:
-            setattr(self, q, advect(getattr(self, q)))
+    def step(self):
+        # Apply advection to each axis of the velocity field and each
+        # user-defined quantity in place, sharing one advection map.
+        self.advector.advect(self.velocity, self.indices, *self.velocity,
+                             *(getattr(self, q) for q in self.quantities))
 
         # Compute the jacobian at each point in the
         # velocity field to extract curl and divergence.
-        jacobian_shape = (self.dimensions,) * 2
-        partials = tuple(np.gradient(d) for d in self.velocity)
-        jacobian = np.stack(partials).reshape(*jacobian_shape, *self.shape)
+        for d in range(self.dimensions):
+            gradient(self.velocity[d], out=self.jacobian[d])
 
-        divergence = jacobian.trace()
+        self.divergence.fill(0)
+        for d in range(self.dimensions):
+            self.divergence += self.jacobian[d, d]
 
-        # If this curl calculation is extended to 3D, the y-axis value must be negated.
-        # This corresponds to the coefficients of the levi-civita symbol in that dimension.
-        # Higher dimensions do not have a vector -> scalar, or vector -> vector,
-        # correspondence between velocity and curl due to differing isomorphisms
-        # between exterior powers in dimensions != 2 or 3 respectively.
-        curl_mask = np.triu(np.ones(jacobian_shape, dtype=bool), k=1)
-        curl = (jacobian[curl_mask] - jacobian[curl_mask.T]).squeeze()
+        for k, (i, j) in enumerate(self.curl_pairs):
+            np.subtract(self.jacobian[i, j], self.jacobian[j, i], out=self.curl[k])
+        curl = self.curl.squeeze()
 
         # Apply the pressure correction to the fluid's velocity field.
-        pressure = self.pressure_solver(divergence.flatten()).reshape(self.shape)
-        self.velocity -= np.gradient(pressure)
+        self.pressure[...] = self.pressure_solver(self.divergence.reshape(-1)).reshape(self.shape)
+        self.velocity -= gradient(self.pressure, out=self.pressure_gradient)
 
-        return divergence, curl, pressure
+        if self.inplace:
+            return self.divergence, curl, self.pressure
+        return self.divergence.copy(), curl.copy(), self.pressure.copy()
@@ -16,10 +16,27 @@ def difference(derivative, accuracy=1):
     return coefficients[-derivative] * factorial(derivative - 1), points
 
 
+def factors(shape, *differences):
+    # One banded 1D operator per axis, the operator below is their Kronecker sum.
+    differences = zip(shape, cycle(differences))
+    return [sp.diags(*diff, shape=(dim,) * 2) for dim, diff in differences]
+
+
 def operator(shape, *differences):
     # Credit to Philip Zucker for figuring out
     # that kronsum's argument order is reversed.
     # Without that bit of wisdom I'd have lost it.
-    differences = zip(shape, cycle(differences))
-    factors = (sp.diags(*diff, shape=(dim,) * 2) for dim, diff in differences)
-    return reduce(lambda a, f: sp.kronsum(f, a, format='csc'), factors)
+    return reduce(lambda a, f: sp.kronsum(f, a, format='csc'), factors(shape, *differences))
+
+
+def gradient(field, out):
+    # np.gradient(field) with unit spacing and first order edges,
+    # written into the preallocated (field.ndim, *field.shape) array out.
+    for axis in range(field.ndim):
+        f = np.moveaxis(field, axis, 0)
+        o = np.moveaxis(out[axis], axis, 0)
+        np.subtract(f[2:], f[:-2], out=o[1:-1])
+        o[1:-1] /= 2
+        np.subtract(f[1], f[0], out=o[0])
+        np.subtract(f[-1], f[-2], out=o[-1])
+    return out
@@ -0,0 +1,73 @@
+import json
+import os
+import resource
+
+import numpy as np
+
+
+class NpyStreamWriter:
+    """
+    Appends frames to a (frames, *shape) .npy file one at a time.
+
+    The header is written up front for the full frame count and every frame
+    goes straight to the file, so memory use does not depend on the number
+    of frames. The result loads with np.load(path, mmap_mode='r').
+    """
+
+    def __init__(self, path, frames, shape, dtype):
+        self.path = path
+        self.frames = frames
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.written = 0
+
+        self.file = open(path, 'wb')
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                  'shape': (frames, *self.shape)}
+        np.lib.format.write_array_header_1_0(self.file, header)
+
+    def write(self, frame):
+        if self.written == self.frames:
+            raise ValueError(f'{self.path} already holds {self.frames} frames')
+        self.file.write(np.ascontiguousarray(frame, dtype=self.dtype).tobytes())
+        self.written += 1
+
+    def close(self):
+        # Pad an interrupted run with zeros so the header stays valid.
+        blank = np.zeros(self.shape, dtype=self.dtype).tobytes()
+        for _ in range(self.written, self.frames):
+            self.file.write(blank)
+        self.file.close()
+
+
+class ImageSequenceWriter:
+    """Saves each frame as its own numbered image file, e.g. frame_00042.png."""
+
+    def __init__(self, directory, pattern='frame_{:05d}.png'):
+        self.directory = directory
+        self.pattern = pattern
+        self.written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, image):
+        image.save(os.path.join(self.directory, self.pattern.format(self.written)))
+        self.written += 1
+
+    def close(self):
+        pass
+
+
+def write_metadata(directory, **metadata):
+    with open(os.path.join(directory, 'metadata.json'), 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process so far, in MB.
+
+    The peak never goes down, so a measurement that should not count what ran
+    before it has to run in a fresh process.
+    """
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from scipy import fft
+
+from numerical import difference, factors
+
+# Solvers are cached here as one directory of .npy files per key.
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+CACHE_VERSION = 1
+
+# numerical.operator truncates the stencil at the grid edge, which is
+# a homogeneous Dirichlet boundary. It is the only one built so far.
+BOUNDARIES = ('dirichlet',)
+
+# The spectral solver diagonalizes each axis with a fast transform instead:
+# DST-I for Dirichlet, DCT-II for Neumann and the FFT for periodic edges.
+SPECTRAL_BOUNDARIES = ('dirichlet', 'neumann', 'periodic')
+
+
+class SeparableSolver:
+    """
+    Direct solver for a Kronecker sum of symmetric 1D operators.
+
+    With each axis operator diagonalized as Q diag(l) Q^T, the inverse of the
+    full Laplacian is a change of basis along every axis, a division by the
+    summed eigenvalues and the change back. Only the per-axis eigenpairs are
+    stored, so memory is sum(n^2) rather than the fill-in of a sparse LU, and
+    the arrays can be memory-mapped straight from the cache.
+    """
+
+    def __init__(self, shape, eigenvalues, eigenvectors, dtype=np.float64):
+        self.shape = tuple(shape)
+        self.eigenvalues = eigenvalues
+        # Memory-mapped float64 arrays are only copied when another precision is asked for.
+        self.eigenvectors = [np.asarray(q, dtype=dtype) for q in eigenvectors]
+
+        dimensions = len(self.shape)
+        self.denominator = sum(np.reshape(l, [-1 if a == d else 1 for a in range(dimensions)])
+                               for d, l in enumerate(eigenvalues)).astype(dtype)
+
+    def __call__(self, rhs):
+        # Same calling convention as scipy.sparse.linalg.factorized.
+        x = np.reshape(rhs, self.shape)
+        for d, q in enumerate(self.eigenvectors):
+            x = np.moveaxis(np.tensordot(x, q, axes=(d, 0)), -1, d)
+        x = x / self.denominator
+        for d, q in enumerate(self.eigenvectors):
+            x = np.moveaxis(np.tensordot(x, q.T, axes=(d, 0)), -1, d)
+        return x.reshape(-1)
+
+
+class SpectralSolver:
+    """
+    Poisson solver that diagonalizes the Laplacian with fast transforms.
+
+    The eigenvalue of each transform mode is the stencil's symbol at the
+    mode's frequency, precomputed per axis, so a solve is a forward
+    transform, a division and an inverse transform: O(n log n) and no
+    factorization. For pressure_order=1 this is the exact inverse of the
+    three point stencil with that boundary (for Dirichlet, the operator
+    numerical.operator builds); wider stencils are only exact with periodic
+    edges. The Neumann operator is singular, its constant mode is set to zero.
+    """
+
+    def __init__(self, shape, pressure_order=1, boundary='dirichlet', dtype=np.float64):
+        if boundary not in SPECTRAL_BOUNDARIES:
+            raise ValueError(f'Unsupported boundary type: {boundary}')
+        self.shape = tuple(shape)
+        self.boundary = boundary
+
+        coefficients, points = difference(2, pressure_order)
+        dimensions = len(self.shape)
+        eigenvalues = []
+        for d, n in enumerate(self.shape):
+            if boundary == 'dirichlet':
+                theta = np.pi * np.arange(1, n + 1) / (n + 1)
+            elif boundary == 'neumann':
+                theta = np.pi * np.arange(n) / n
+            else:
+                theta = 2 * np.pi * np.fft.fftfreq(n)
+            symbol = sum(c * np.cos(p * theta) for c, p in zip(coefficients, points))
+            eigenvalues.append(np.reshape(symbol, [-1 if a == d else 1 for a in range(dimensions)]))
+
+        self.denominator = sum(eigenvalues).astype(dtype)
+        if boundary != 'dirichlet':
+            # Zero frequency, leaves the mean pressure at zero instead of dividing by zero.
+            self.denominator[(0,) * dimensions] = np.inf
+
+    def __call__(self, rhs):
+        # Same calling convention as scipy.sparse.linalg.factorized.
+        x = np.reshape(rhs, self.shape)
+        if self.boundary == 'dirichlet':
+            x = fft.idstn(fft.dstn(x, type=1) / self.denominator, type=1)
+        elif self.boundary == 'neumann':
+            x = fft.idctn(fft.dctn(x, type=2) / self.denominator, type=2)
+        else:
+            x = fft.ifftn(fft.fftn(x) / self.denominator).real
+        return x.reshape(-1)
+
+
+def cache_key(shape, pressure_order, boundary):
+    return 'laplacian_%s_order%d_%s_v%d' % ('x'.join(map(str, shape)), pressure_order, boundary, CACHE_VERSION)
+
+
+def build_pressure_solver(shape, pressure_order=1, boundary='dirichlet', dtype=np.float64):
+    if boundary not in BOUNDARIES:
+        raise ValueError(f'Unsupported boundary type: {boundary}')
+
+    eigenvalues, eigenvectors = [], []
+    for factor in factors(shape, difference(2, pressure_order)):
+        l, q = np.linalg.eigh(factor.toarray())
+        eigenvalues.append(l)
+        eigenvectors.append(q)
+    return SeparableSolver(shape, eigenvalues, eigenvectors, dtype)
+
+
+def load_pressure_solver(shape, pressure_order=1, boundary='dirichlet', cache_directory=CACHE_DIRECTORY,
+                         dtype=np.float64):
+    """
+    Build the pressure solver, or load it if an earlier run cached it.
+
+    Cached arrays are opened with mmap_mode='r', so a warm start only
+    maps the files. Pass cache_directory=None to skip the cache. The
+    cache always holds float64; other dtypes are converted on load.
+    """
+    if cache_directory is None:
+        return build_pressure_solver(shape, pressure_order, boundary, dtype)
+
+    path = os.path.join(cache_directory, cache_key(shape, pressure_order, boundary))
+    if not os.path.isdir(path):
+        save_pressure_solver(build_pressure_solver(shape, pressure_order, boundary), path)
+
+    eigenvalues, eigenvectors = [], []
+    for d in range(len(shape)):
+        eigenvalues.append(np.load(os.path.join(path, f'eigenvalues_{d}.npy'), mmap_mode='r'))
+        eigenvectors.append(np.load(os.path.join(path, f'eigenvectors_{d}.npy'), mmap_mode='r'))
+    return SeparableSolver(shape, eigenvalues, eigenvectors, dtype)
+
+
+def save_pressure_solver(solver, path):
+    # Write into a scratch directory and rename it into place, so
+    # concurrent runs never load a half written entry.
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    scratch = tempfile.mkdtemp(dir=parent)
+    try:
+        for d, (l, q) in enumerate(zip(solver.eigenvalues, solver.eigenvectors)):
+            np.save(os.path.join(scratch, f'eigenvalues_{d}.npy'), l)
+            np.save(os.path.join(scratch, f'eigenvectors_{d}.npy'), q)
+        os.rename(scratch, path)
+    except OSError:
+        shutil.rmtree(scratch, ignore_errors=True)
+        # Another run got there first.
+        if not os.path.isdir(path):
+            raise
@@ -0,0 +1,103 @@
+import numpy as np
+import pygame
+from PIL import Image
+from scipy.special import erf
+
+# Curl is binned over [-CURL_LIMIT, CURL_LIMIT] before the hue lookup,
+# erf(2 * CURL_LIMIT) is 1 to double precision so nothing is lost outside.
+CURL_LIMIT = 4.0
+CURL_BINS = 1 << 14
+
+
+def hsv_table():
+    # Every (hue, value) byte pair at full saturation, converted by PIL so
+    # the colors match Image.fromarray(..., mode='HSV').convert('RGB').
+    h, v = np.meshgrid(np.arange(256, dtype=np.uint8), np.arange(256, dtype=np.uint8), indexing='ij')
+    hsv = np.dstack((h, np.full_like(h, 255), v))
+    rgb = Image.fromarray(hsv, mode='HSV').convert('RGB')
+    return np.asarray(rgb).reshape(-1, 3)
+
+
+def curl_hue_table():
+    # Hue byte of each curl bin, using the same contrast curve as scenario.colorize.
+    curl = np.linspace(-CURL_LIMIT, CURL_LIMIT, CURL_BINS)
+    hue = (erf(curl * 2) + 1) / 4
+    return (np.clip(hue, 0, 1) * 255).astype(np.intp)
+
+
+def linear_table(*colors):
+    # 256 entry colormap interpolated between evenly spaced colors.
+    colors = np.asarray(colors, dtype=float)
+    stops = np.linspace(0, 255, len(colors))
+    return np.stack([np.interp(np.arange(256), stops, c) for c in colors.T], axis=1).round().astype(np.uint8)
+
+
+GRAYSCALE = linear_table((0, 0, 0), (255, 255, 255))
+DIVERGING = linear_table((59, 76, 192), (221, 221, 221), (180, 4, 38))
+
+
+class FieldRenderer:
+    """
+    Colormaps Fluid fields straight into a pygame surface.
+
+    Each frame computes one lookup index per cell into preallocated buffers
+    and gathers the colors from a table directly into the surface's pixels,
+    with no intermediate images. present() scales the surface onto the
+    window, whatever size it has been resized to.
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        # Fields are indexed [row, column], surfaces [x, y].
+        self.surface = pygame.Surface((self.shape[1], self.shape[0]))
+        surface_shape = (self.shape[1], self.shape[0])
+        self.scratch = np.empty(surface_shape)
+        self.index = np.empty(surface_shape, dtype=np.intp)
+        self.value = np.empty(surface_shape, dtype=np.intp)
+
+        self.hsv = hsv_table()
+        self.curl_rows = curl_hue_table() * 256
+
+    def curl_dye(self, curl, dye):
+        """The example.py look: curl as hue, dye as value."""
+        scale = (CURL_BINS - 1) / (2 * CURL_LIMIT)
+        np.multiply(curl.T, scale, out=self.scratch)
+        self.scratch += CURL_LIMIT * scale + 0.5
+        np.clip(self.scratch, 0, CURL_BINS - 1, out=self.scratch)
+        self.index[...] = self.scratch
+        np.take(self.curl_rows, self.index, out=self.index)
+
+        np.clip(dye.T, 0, 1, out=self.scratch)
+        self.scratch *= 255
+        self.value[...] = self.scratch
+        self.index += self.value
+        return self._fill(self.hsv)
+
+    def scalar(self, field, colormap=DIVERGING, low=None, high=None):
+        """
+        Any scalar field, e.g. pressure or divergence, through a 256 entry colormap.
+
+        Without limits the range is symmetric about zero and fitted to the frame.
+        """
+        if low is None or high is None:
+            extent = float(np.abs(field).max()) or 1.0
+            low, high = -extent, extent
+        np.subtract(field.T, low, out=self.scratch)
+        self.scratch *= 255 / (high - low)
+        np.clip(self.scratch, 0, 255, out=self.scratch)
+        self.index[...] = self.scratch
+        return self._fill(colormap)
+
+    def _fill(self, table):
+        pixels = pygame.surfarray.pixels3d(self.surface)
+        np.take(table, self.index, axis=0, out=pixels, mode='clip')
+        # The surface stays locked while the pixel view exists.
+        del pixels
+        return self.surface
+
+    def present(self, screen):
+        size = screen.get_size()
+        if size == self.surface.get_size():
+            screen.blit(self.surface, (0, 0))
+        else:
+            pygame.transform.scale(self.surface, size, screen)
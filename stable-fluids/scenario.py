@@ -0,0 +1,45 @@
+import numpy as np
+from PIL import Image
+from scipy.special import erf
+
+# Defaults of the example.py scenario: INFLOW_COUNT jets on a circle
+# INFLOW_PADDING cells inside the grid edge, pointing at the center.
+INFLOW_PADDING = 50
+INFLOW_DURATION = 60
+INFLOW_RADIUS = 8
+INFLOW_VELOCITY = 1
+INFLOW_COUNT = 5
+
+
+def inflow(fluid, padding=INFLOW_PADDING, radius=INFLOW_RADIUS, velocity=INFLOW_VELOCITY, count=INFLOW_COUNT):
+    """
+    Velocity and dye added to a 2D fluid every frame while the inflow lasts.
+
+    :return: (inflow_velocity, inflow_dye), shaped like fluid.velocity and fluid.shape.
+    """
+    center = np.floor_divide(fluid.shape, 2)
+    r = np.min(center) - padding
+
+    points = np.linspace(-np.pi, np.pi, count, endpoint=False)
+    points = tuple(np.array((np.cos(p), np.sin(p))) for p in points)
+    normals = tuple(-p for p in points)
+    points = tuple(r * p + center for p in points)
+
+    inflow_velocity = np.zeros_like(fluid.velocity)
+    inflow_dye = np.zeros(fluid.shape, dtype=fluid.dtype)
+    for p, n in zip(points, normals):
+        mask = np.linalg.norm(fluid.indices - p[:, None, None], axis=0) <= radius
+        inflow_velocity[:, mask] += n[:, None] * velocity
+        inflow_dye[mask] = 1
+    return inflow_velocity, inflow_dye
+
+
+def colorize(curl, dye):
+    """Curl as hue and dye as value, returned as an RGB PIL image."""
+    # Using the error function to make the contrast a bit higher.
+    # Any other sigmoid function e.g. smoothstep would work.
+    curl = (erf(curl * 2) + 1) / 4
+
+    color = np.dstack((curl, np.ones(dye.shape), dye))
+    color = (np.clip(color, 0, 1) * 255).astype('uint8')
+    return Image.fromarray(color, mode='HSV').convert('RGB')
@@ -0,0 +1,65 @@
+"""
+Rendered text kept between frames, so HUD text is only rasterized when it changes.
+
+TextCache keeps the surfaces of the most recently drawn (font, text, color)
+combinations and evicts the least recently used ones beyond its capacity. A
+dynamic field such as a ball count is rendered again only when the displayed
+value changes. Lines that never change are better composed once with
+compose_text() into a single layer, blitted as one surface.
+
+    text_cache = TextCache()
+    help_layer = compose_text(font, [("[R] to reset", (5, 580))], FONT_COLOR, screen.get_size())
+    while running:
+        screen.blit(help_layer, (0, 0))
+        screen.blit(text_cache.render(font, f"Balls: {count}", FONT_COLOR), (0, 15))
+"""
+from collections import OrderedDict
+
+import pygame
+
+TEXT_CACHE_SIZE = 256
+
+
+class TextCache:
+    def __init__(self, capacity=TEXT_CACHE_SIZE):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def render(self, font, text, color, antialias=True):
+        """Same as font.render(text, antialias, color), from the cache when the text was rendered before."""
+        key = (font, text, tuple(color), antialias)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+def compose_text(font, lines, color, size):
+    """
+    Renders lines of text once into a single transparent layer.
+
+    :param lines: (text, position) pairs, positioned within the layer.
+    :param size: Size of the layer, e.g. the screen size.
+    :return: The layer, run-length encoded so its transparent area costs little to blit.
+    """
+    layer = pygame.Surface(size, pygame.SRCALPHA)
+    for text, position in lines:
+        layer.blit(font.render(text, True, color), position)
+    layer.set_alpha(255, pygame.RLEACCEL)
+    return layer